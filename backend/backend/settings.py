@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -146,3 +147,75 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Кэширование
+# Бэкенд кэша ответов каталога выбирается переменной окружения CATALOG_CACHE_BACKEND:
+# "locmem" (по умолчанию, в памяти процесса) или "file" (общий для всех воркеров на одной машине).
+# Ответы сбрасываются увеличением версии каталога в этом же кэше. С "locmem" версию увеличивает
+# только воркер, через который прошла правка (админка, API, recount_category_products), —
+# остальные отдают старые цены, остатки и products_count, пока не истечёт CATALOG_CACHE_TIMEOUT
+# (до 5 минут). Если воркеров несколько и такая задержка недопустима, нужен "file" (или сетевой
+# бэкенд при нескольких машинах). Индексы поиска от бэкенда не зависят (CATALOG_SYNC_INTERVAL)
+CATALOG_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CATALOG_CACHE_LOCATION', str(BASE_DIR / 'cache' / 'catalog')),
+    },
+}
+
+# Сводки корзин и их версии (CART_CACHE_BACKEND): "file" (по умолчанию) или "locmem"
+CART_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cart',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CART_CACHE_LOCATION', str(BASE_DIR / 'cache' / 'cart')),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        **CATALOG_CACHE_BACKENDS[os.environ.get('CATALOG_CACHE_BACKEND', 'locmem')],
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Сводки корзин и их версии. Версию сбрасывает воркер, изменивший корзину, поэтому кэш
+    # обязан быть общим для всех воркеров: по умолчанию файловый (CART_CACHE_LOCATION), для
+    # нескольких машин — сетевой бэкенд (Redis, Memcached). "locmem" годится только для одного процесса
+    'cart': {
+        **CART_CACHE_BACKENDS[os.environ.get('CART_CACHE_BACKEND', 'file')],
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Время жизни закэшированного ответа каталога, секунды; с "locmem" и несколькими воркерами —
+# это и предельное время, которое другие воркеры отдают каталог после правки
+CATALOG_CACHE_TIMEOUT = 300
+
+# Сводка корзины (/api/cart/summary/), секунды; сбрасывается при любом изменении корзины через API,
+# а короткий срок ограничивает устаревание после правок в обход API (админка, shell)
+CART_SUMMARY_TIMEOUT = 60
+
+# Поиск товаров: "index" (индекс в памяти процесса), "fts" (FTS5 в SQLite) или "orm" (icontains)
+PRODUCT_SEARCH_BACKEND = os.environ.get('PRODUCT_SEARCH_BACKEND', 'index')
+
+# Индексы поиска, подсказки и кэш результатов живут в памяти процесса; изменения из других
+# воркеров они замечают по отметке из базы, которая перечитывается не чаще раза в столько секунд
+CATALOG_SYNC_INTERVAL = 30
+
+# Кэш результатов поиска в памяти процесса: число запросов (LRU) и время жизни записи, секунды
+SEARCH_RESULT_CACHE_SIZE = 1000
+SEARCH_RESULT_CACHE_TIMEOUT = 300
+
+# Выгрузки заказов и товаров (products/export.py): строк в одной пачке чтения из базы
+EXPORT_CHUNK_SIZE = 2000
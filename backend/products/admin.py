@@ -1,11 +1,12 @@
 from django.contrib import admin
 from .models import Category, Product, Cart, CartItem, Favorite, Order, OrderItem
+from .sales import order_items_changed, record_order
 
 # Register your models here.
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'description', 'is_active', 'created_at']
+    list_display = ['name', 'description', 'is_active', 'products_count', 'created_at']
     list_filter = ['is_active', 'created_at']
     search_fields = ['name', 'description']
     prepopulated_fields = {'slug': ('name',)}
@@ -27,10 +28,16 @@ class CartAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'user__email']
     readonly_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']
+    list_select_related = ['user']
+    
+    def get_queryset(self, request):
+        # total_price и total_items считаются в том же запросе, а не отдельно для каждой строки
+        return super().get_queryset(request).with_totals()
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ['cart', 'product', 'quantity', 'total_price', 'added_at']
+    list_select_related = ['cart__user', 'product']
     list_filter = ['added_at']
     search_fields = ['product__name', 'cart__user__username']
     readonly_fields = ['added_at']
@@ -68,12 +75,33 @@ class OrderAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Смену статуса переносит сигнал; новый заказ (ещё без позиций) учитываем здесь
+        if not change:
+            record_order(obj, {})
 
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ['order', 'product', 'quantity', 'price', 'total_price']
+    list_display = ['order', 'product_name', 'quantity', 'price', 'total_price']
     list_filter = ['order__status']
-    search_fields = ['product__name', 'order__id']
-    readonly_fields = ['price']
+    list_select_related = ['order__user']
+    search_fields = ['product_name', 'order__id']
+    readonly_fields = ['price', 'product_name', 'product_slug', 'product_image', 'category']
     ordering = ['order__id', 'id']
+    
+    # Позиции меняют сводки продаж: вклад затронутых заказов пересчитывается (products/sales.py)
+    def save_model(self, request, obj, form, change):
+        order_ids = {obj.order_id, form.initial.get('order')} - {None}
+        with order_items_changed(order_ids):
+            super().save_model(request, obj, form, change)
+    
+    def delete_model(self, request, obj):
+        with order_items_changed([obj.order_id]):
+            super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        with order_items_changed(set(queryset.values_list('order_id', flat=True))):
+            super().delete_queryset(request, queryset)
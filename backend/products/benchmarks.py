@@ -0,0 +1,92 @@
+"""
+Общие утилиты для команд бенчмарков (products/management/commands/bench_*.py).
+
+Бенчмарки работают на отдельной тестовой базе с синтетическим каталогом,
+рабочая база не затрагивается.
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from .models import Category, Product
+from .signals import recount_category_products
+
+WORDS = [
+    'кубик', 'пластина', 'колесо', 'ось', 'балка', 'шестерня', 'мотор', 'кирпич', 'окно', 'дверь',
+    'lego', 'technic', 'brick', 'plate', 'gear', 'wheel', 'axle', 'beam', 'красный', 'синий',
+    'жёлтый', 'зелёный', 'чёрный', 'белый', 'большой', 'малый', 'угловой', 'круглый', 'прозрачный', 'набор',
+]
+
+
+@contextmanager
+def benchmark_database():
+    """Временная тестовая база на время бенчмарка"""
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+@contextmanager
+def _explicit_created_at():
+    # auto_now_add перезаписал бы created_at при вставке, и у всех товаров была бы одна дата
+    field = Product._meta.get_field('created_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def create_synthetic_catalog(products, categories=20, batch_size=5000, seed=1):
+    """Создаёт категории и товары bulk-вставками; created_at у товаров различается на секунду"""
+    rng = random.Random(seed)
+    category_objs = Category.objects.bulk_create(
+        Category(name=f'Категория {c}', slug=f'bench-category-{c}', description=f'Описание категории {c}')
+        for c in range(categories)
+    )
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    with _explicit_created_at():
+        _create_products(products, category_objs, rng, base, batch_size)
+    recount_category_products()
+    return category_objs
+
+
+def _create_products(products, categories, rng, base, batch_size):
+    batch = []
+    for i in range(products):
+        name = ' '.join(rng.sample(WORDS, 3)).capitalize() + f' {i}'
+        batch.append(Product(
+            name=name,
+            description=' '.join(rng.choices(WORDS, k=12)),
+            slug=f'bench-product-{i}',
+            category=categories[i % len(categories)],
+            price=Decimal(rng.randint(100, 100000)) / 100,
+            stock=rng.randint(0, 50),
+            is_available=rng.random() > 0.05,
+            is_featured=rng.random() < 0.1,
+            created_at=base + timedelta(seconds=i),
+        ))
+        if len(batch) >= batch_size:
+            Product.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Product.objects.bulk_create(batch)
+
+
+def measure(func, repeat=5):
+    """Минимальное время выполнения func за repeat запусков, в миллисекундах"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
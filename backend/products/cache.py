@@ -0,0 +1,181 @@
+"""
+Кэш ответов каталога.
+
+Ключ ответа содержит номер версии каталога. Любое изменение товара или категории
+увеличивает версию (см. products/signals.py), и все старые записи перестают
+находиться — удалять их не нужно, они вытесняются по таймауту.
+
+Остатки меняются при каждом заказе, и сбрасывать из-за этого весь каталог
+дорого. Поэтому оформление заказа только отмечает время изменения остатка
+купленных товаров (mark_stock_changed), а запись ответа, в котором есть остаток
+такого товара, считается устаревшей, если он изменился после её расчёта.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+CATALOG_CACHE_ALIAS = 'catalog'
+CART_CACHE_ALIAS = 'cart'
+CATALOG_VERSION_KEY = 'catalog:version'
+FAVORITES_VERSION_KEY = 'catalog:favorites:{user_id}'
+CART_VERSION_KEY = 'cart:version:{user_id}'
+STOCK_CHANGED_KEY = 'catalog:stock:{product_id}'
+HITS_KEY = 'catalog:stats:hits'
+MISSES_KEY = 'catalog:stats:misses'
+# Запас на расхождение часов между воркерами при сравнении времени изменения остатка, секунды
+STOCK_CLOCK_SKEW = 2
+
+
+def get_catalog_cache():
+    return caches[CATALOG_CACHE_ALIAS]
+
+
+def get_cart_cache():
+    """Кэш сводок корзины — общий для воркеров (см. CART_CACHE_BACKEND в settings.py)"""
+    return caches[CART_CACHE_ALIAS]
+
+
+def _get_version(key, cache=None):
+    cache = cache or get_catalog_cache()
+    version = cache.get(key)
+    if version is None:
+        # Начинаем с текущего времени, а не с 1: если ключ версии был вытеснен,
+        # новая версия не совпадёт ни с одной из уже закэшированных
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key, cache=None):
+    cache = cache or get_catalog_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+
+
+def get_catalog_version():
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """Инвалидировать все закэшированные ответы каталога"""
+    _bump_version(CATALOG_VERSION_KEY)
+
+
+def bump_favorites_version(user_id):
+    """Инвалидировать закэшированные ответы конкретного пользователя (is_favorited)"""
+    _bump_version(FAVORITES_VERSION_KEY.format(user_id=user_id))
+
+
+def bump_cart_version(user_id):
+    """Инвалидировать закэшированную сводку корзины пользователя"""
+    _bump_version(CART_VERSION_KEY.format(user_id=user_id), get_cart_cache())
+
+
+def mark_stock_changed(product_ids):
+    """Отметить изменение остатков товаров: закэшированные ответы с их остатком перестанут отдаваться"""
+    changed_at = time.time()
+    get_catalog_cache().set_many(
+        {STOCK_CHANGED_KEY.format(product_id=product_id): changed_at for product_id in product_ids},
+        settings.CATALOG_CACHE_TIMEOUT,
+    )
+
+
+def _stock_product_ids(data):
+    """id товаров, остаток которых есть в ответе (с ?fields= без stock — ни одного)"""
+    product_ids = []
+    values = [data]
+    while values:
+        value = values.pop()
+        if isinstance(value, dict):
+            if 'stock' in value and 'id' in value:
+                product_ids.append(value['id'])
+            values.extend(value.values())
+        elif isinstance(value, list):
+            values.extend(value)
+    return product_ids
+
+
+def _stock_changed_since(product_ids, cached_at):
+    if not product_ids:
+        return False
+    changed = get_catalog_cache().get_many([STOCK_CHANGED_KEY.format(product_id=product_id) for product_id in product_ids])
+    return any(changed_at >= cached_at - STOCK_CLOCK_SKEW for changed_at in changed.values())
+
+
+def cart_summary_key(user_id):
+    # Версию читаем до подсчёта: если корзину изменят во время подсчёта, запись уйдёт под старую версию
+    return f'cart:summary:{user_id}:{_get_version(CART_VERSION_KEY.format(user_id=user_id), get_cart_cache())}'
+
+
+def catalog_response_key(request):
+    """Ключ: версия каталога + аноним/пользователь + хост, путь и отсортированные параметры"""
+    user = request.user
+    if user.is_authenticated:
+        # В ответах для авторизованных есть is_favorited, поэтому они не делятся между пользователями
+        scope = f'user:{user.pk}:{_get_version(FAVORITES_VERSION_KEY.format(user_id=user.pk))}'
+    else:
+        scope = 'anon'
+    params = sorted(request.query_params.lists())
+    raw = f'{request.get_host()}|{request.path}|{params}'
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return f'catalog:response:{get_catalog_version()}:{scope}:{digest}'
+
+
+def _count(key):
+    cache = get_catalog_cache()
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, timeout=None)
+
+
+def get_cache_stats():
+    cache = get_catalog_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+        'version': get_catalog_version(),
+    }
+
+
+def reset_cache_stats():
+    get_catalog_cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+def cache_catalog_response(view_method):
+    """Декоратор для GET-действий ViewSet: отдаёт сохранённый ответ, пока версия каталога
+    и остатки товаров из ответа не изменились"""
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        cache = get_catalog_cache()
+        key = catalog_response_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            status_code, data, cached_at, stock_product_ids = cached
+            if not _stock_changed_since(stock_product_ids, cached_at):
+                _count(HITS_KEY)
+                response = Response(data, status=status_code)
+                response['X-Cache'] = 'HIT'
+                return response
+
+        _count(MISSES_KEY)
+        # Время берём до чтения базы: остаток, изменённый во время расчёта, сделает запись устаревшей
+        started_at = time.time()
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            entry = (response.status_code, response.data, started_at, _stock_product_ids(response.data))
+            cache.set(key, entry, settings.CATALOG_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+    return wrapper
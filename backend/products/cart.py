@@ -0,0 +1,260 @@
+"""
+Изменения корзины одним SQL-оператором.
+
+Количество меняется в базе (upsert / UPDATE), а проверка остатка стоит
+в том же операторе, поэтому параллельные запросы не теряют прибавления и не
+могут положить в корзину больше, чем есть на складе. Если оператор ничего не
+изменил, отдельным запросом выясняется причина для ответа клиенту.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+from rest_framework import status
+
+from .cache import bump_catalog_version, bump_cart_version, cart_summary_key, get_cart_cache, mark_stock_changed
+from .models import Cart, CartItem, Order, OrderItem, Product
+from .sales import order_buckets, record_order
+
+
+class CartError(Exception):
+    """Ошибка изменения корзины: текст для клиента и HTTP-статус"""
+
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+NOT_AVAILABLE = 'Товар не найден или недоступен'
+NOT_ENOUGH_STOCK = 'Недостаточно товара на складе'
+ITEM_NOT_FOUND = 'Элемент корзины не найден'
+
+_ADD_ITEM_SQL = '''
+    INSERT INTO {item} (cart_id, product_id, quantity, added_at)
+    SELECT %s, p.id, %s, %s FROM {product} p
+    WHERE p.id = %s AND p.is_available AND p.stock >= %s
+    ON CONFLICT (cart_id, product_id) DO UPDATE
+    SET quantity = {item}.quantity + excluded.quantity
+    WHERE (SELECT stock FROM {product} WHERE id = excluded.product_id) >= {item}.quantity + excluded.quantity
+'''
+
+
+def _add_item_sql():
+    return _ADD_ITEM_SQL.format(
+        item=connection.ops.quote_name(CartItem._meta.db_table),
+        product=connection.ops.quote_name(Product._meta.db_table),
+    )
+
+
+def touch_cart(cart_id, user_id):
+    """Обновить updated_at корзины без чтения модели и сбросить её сводку после коммита"""
+    Cart.objects.filter(pk=cart_id).update(updated_at=timezone.now())
+    transaction.on_commit(lambda: bump_cart_version(user_id))
+
+
+def get_cart_summary(user):
+    """Сводка корзины {items, total} из кэша; второй элемент — было ли попадание"""
+    cache = get_cart_cache()
+    key = cart_summary_key(user.pk)
+    summary = cache.get(key)
+    if summary is not None:
+        return summary, True
+    totals = Cart.objects.filter(user=user).with_totals().values('items_total_quantity', 'items_total_price').first()
+    summary = {
+        'items': totals['items_total_quantity'] if totals else 0,
+        'total': totals['items_total_price'] if totals else Decimal('0.00'),
+    }
+    cache.set(key, summary, settings.CART_SUMMARY_TIMEOUT)
+    return summary, False
+
+
+def _product_error(product_id):
+    if Product.objects.filter(id=product_id, is_available=True).exists():
+        return CartError(NOT_ENOUGH_STOCK)
+    return CartError(NOT_AVAILABLE, status.HTTP_404_NOT_FOUND)
+
+
+def add_item(cart, product_id, quantity):
+    """Прибавить количество товара (или добавить позицию), если всё количество есть на складе"""
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(_add_item_sql(), [cart.id, quantity, timezone.now(), product_id, quantity])
+            changed = cursor.rowcount
+        if not changed:
+            raise _product_error(product_id)
+        touch_cart(cart.id, cart.user_id)
+
+
+def set_item_quantity(user, item_id, quantity):
+    """Установить количество позиции корзины пользователя; возвращает id корзины"""
+    with transaction.atomic():
+        items = CartItem.objects.filter(id=item_id, cart__user=user)
+        changed = items.filter(product__stock__gte=quantity).update(quantity=quantity)
+        cart_id = items.values_list('cart_id', flat=True).first()
+        if cart_id is None:
+            raise CartError(ITEM_NOT_FOUND, status.HTTP_404_NOT_FOUND)
+        if not changed:
+            raise CartError(NOT_ENOUGH_STOCK)
+        touch_cart(cart_id, user.pk)
+        return cart_id
+
+
+def remove_item(user, item_id):
+    """Удалить позицию корзины пользователя; возвращает id корзины"""
+    with transaction.atomic():
+        cart_id = CartItem.objects.filter(id=item_id, cart__user=user).values_list('cart_id', flat=True).first()
+        if cart_id is None:
+            raise CartError(ITEM_NOT_FOUND, status.HTTP_404_NOT_FOUND)
+        CartItem.objects.filter(id=item_id).delete()
+        touch_cart(cart_id, user.pk)
+        return cart_id
+
+
+def apply_operations(cart, operations, atomic=False):
+    """Применить пакет операций к корзине в одной транзакции.
+
+    operations — список проверенных CartOperationSerializer словарей или
+    {'error': ...} для операций, не прошедших проверку. Операции применяются по
+    порядку к состоянию корзины в памяти, затем изменения пишутся тремя
+    запросами: bulk_create, bulk_update и удаление. Возвращает результаты по
+    операциям; при atomic=True и любой ошибке корзина не меняется.
+    """
+    with transaction.atomic():
+        # Первая запись в транзакции блокирует корзину (в SQLite — всю базу на запись),
+        # поэтому прочитанное ниже состояние не изменится до коммита
+        touch_cart(cart.id, cart.user_id)
+        existing = {item.product_id: item for item in CartItem.objects.filter(cart=cart).select_for_update()}
+        product_by_item = {item.id: item.product_id for item in existing.values()}
+        product_ids = {op['product_id'] for op in operations if 'product_id' in op}
+        product_ids.update(product_by_item[op['item_id']] for op in operations if op.get('item_id') in product_by_item)
+        products = Product.objects.filter(id__in=product_ids).select_for_update()
+        products = {product['id']: product for product in products.values('id', 'stock', 'is_available')}
+
+        quantities = {product_id: item.quantity for product_id, item in existing.items()}
+        results = []
+        for op in operations:
+            try:
+                if 'error' in op:
+                    raise CartError(op['error'])
+                _apply_operation(op, quantities, product_by_item, products)
+                results.append({'status': 'ok'})
+            except CartError as e:
+                results.append({'status': 'error', 'error': e.message, 'status_code': e.status_code})
+
+        if atomic and any(result['status'] == 'error' for result in results):
+            transaction.set_rollback(True)
+            return results
+
+        created, updated, removed = [], [], []
+        for product_id, quantity in quantities.items():
+            item = existing.get(product_id)
+            if item is None:
+                if quantity:
+                    created.append(CartItem(cart=cart, product_id=product_id, quantity=quantity))
+            elif not quantity:
+                removed.append(item.id)
+            elif quantity != item.quantity:
+                item.quantity = quantity
+                updated.append(item)
+        if created:
+            CartItem.objects.bulk_create(created)
+        if updated:
+            CartItem.objects.bulk_update(updated, ['quantity'])
+        if removed:
+            CartItem.objects.filter(id__in=removed).delete()
+        return results
+
+
+def _apply_operation(op, quantities, product_by_item, products):
+    action = op['action']
+    if action == 'add':
+        product_id = op['product_id']
+        product = products.get(product_id)
+        if product is None or not product['is_available']:
+            raise CartError(NOT_AVAILABLE, status.HTTP_404_NOT_FOUND)
+        quantity = (quantities.get(product_id) or 0) + op['quantity']
+    else:
+        product_id = product_by_item.get(op['item_id'])
+        # Позиция, удалённая раньше в этом же пакете, тоже считается ненайденной
+        if product_id is None or not quantities.get(product_id):
+            raise CartError(ITEM_NOT_FOUND, status.HTTP_404_NOT_FOUND)
+        if action == 'remove':
+            quantities[product_id] = 0
+            return
+        quantity = op['quantity']
+    if products[product_id]['stock'] < quantity:
+        raise CartError(NOT_ENOUGH_STOCK)
+    quantities[product_id] = quantity
+
+
+def checkout(user, shipping_address, phone, notes=''):
+    """Оформить заказ из корзины одной транзакцией; число запросов не зависит от числа позиций.
+
+    Остатки всех позиций списываются одним условным UPDATE: если хоть одной не
+    хватает, обновится меньше строк, чем позиций, и транзакция откатится.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # Первая запись блокирует корзину и заодно проверяет, что она есть
+        if not Cart.objects.filter(user=user).update(updated_at=now):
+            raise CartError('Корзина не найдена', status.HTTP_404_NOT_FOUND)
+        cart = Cart.objects.get(user=user)
+        lines = list(CartItem.objects.filter(cart=cart).values_list(
+            'product_id', 'quantity', 'product__price', 'product__name', 'product__slug', 'product__image',
+            'product__category_id',
+        ))
+        if not lines:
+            raise CartError('Корзина пуста')
+
+        in_stock = Q()
+        new_stock = []
+        for product_id, quantity, *_snapshot in lines:
+            in_stock |= Q(id=product_id, stock__gte=quantity)
+            new_stock.append(When(id=product_id, then=F('stock') - quantity))
+        # updated_at вручную: update() не трогает auto_now, а по нему досинхронизируются индексы поиска
+        reserved = Product.objects.filter(in_stock, is_available=True).update(
+            stock=Case(*new_stock, output_field=models.PositiveIntegerField()), updated_at=now,
+        )
+        if reserved != len(lines):
+            raise _out_of_stock_error(lines)
+        product_ids = [product_id for product_id, *_rest in lines]
+        # Товар, раскупленный до нуля, меняет выдачу ?in_stock= — это уже изменение каталога
+        sold_out = Product.objects.filter(id__in=product_ids, stock=0).exists()
+
+        order = Order.objects.create(
+            user=user,
+            total_price=sum(price * quantity for _product_id, quantity, price, *_snapshot in lines),
+            shipping_address=shipping_address,
+            phone=phone,
+            notes=notes,
+        )
+        # Снимок товара в позиции: история заказов не зависит от последующих правок каталога
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product_id=product_id, quantity=quantity, price=price,
+                      product_name=name, product_slug=slug, product_image=image or '', category_id=category_id)
+            for product_id, quantity, price, name, slug, image, category_id in lines
+        )
+        # Сводки продаж — из уже прочитанных позиций, без повторного чтения OrderItem
+        record_order(order, order_buckets(
+            (product_id, category_id, quantity, price)
+            for product_id, quantity, price, _name, _slug, _image, category_id in lines
+        ))
+        CartItem.objects.filter(cart=cart).delete()
+        transaction.on_commit(lambda: bump_cart_version(user.pk))
+        # Остатки изменены через update(), сигналы Product не сработали: сбрасываем
+        # только ответы с остатком купленных товаров, а не весь каталог
+        transaction.on_commit(lambda: mark_stock_changed(product_ids))
+        if sold_out:
+            transaction.on_commit(bump_catalog_version)
+        return order
+
+
+def _out_of_stock_error(lines):
+    quantities = {product_id: quantity for product_id, quantity, *_rest in lines}
+    products = Product.objects.filter(id__in=quantities).values_list('id', 'name', 'stock', 'is_available')
+    short = [name for product_id, name, stock, is_available in products
+             if not is_available or stock < quantities[product_id]]
+    return CartError(f'{NOT_ENOUGH_STOCK}: {", ".join(short)}')
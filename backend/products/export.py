@@ -0,0 +1,123 @@
+"""
+Потоковая выгрузка заказов и товаров в CSV или NDJSON.
+
+Строки читаются через values_list(...).iterator(chunk_size=EXPORT_CHUNK_SIZE) —
+без экземпляров моделей и без кэша queryset, — и сразу превращаются в строки
+файла. Поэтому в памяти одновременно находится не больше одной пачки строк,
+сколько бы их ни было всего. Используется и эндпоинтом /api/export/…
+(StreamingHttpResponse), и командой export_data.
+"""
+import csv
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Order, Product
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+# Колонка файла -> поле для values_list; у заказа без позиций колонки позиции пустые
+ORDER_COLUMNS = {
+    'order_id': 'id',
+    'created_at': 'created_at',
+    'status': 'status',
+    'user_email': 'user__email',
+    'order_total': 'total_price',
+    'item_id': 'items__id',
+    'product_id': 'items__product_id',
+    'product_name': 'items__product_name',
+    'quantity': 'items__quantity',
+    'price': 'items__price',
+}
+
+PRODUCT_COLUMNS = {
+    'id': 'id',
+    'name': 'name',
+    'slug': 'slug',
+    'category_id': 'category_id',
+    'category_name': 'category__name',
+    'price': 'price',
+    'stock': 'stock',
+    'is_available': 'is_available',
+    'is_featured': 'is_featured',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+
+# Допустимые значения фильтра status для каждой выгрузки
+PRODUCT_STATUSES = {'available': True, 'hidden': False}
+EXPORT_STATUSES = {
+    'orders': [value for value, _label in Order.STATUS_CHOICES],
+    'products': list(PRODUCT_STATUSES),
+}
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def filter_by_created_date(queryset, date_from, date_to):
+    """Отбор по дате created_at (обе границы включительно, в текущем часовом поясе)"""
+    # Границы — начала суток, чтобы фильтр шёл по самому created_at, без функции над колонкой
+    if date_from:
+        queryset = queryset.filter(created_at__gte=_start_of_day(date_from))
+    if date_to:
+        queryset = queryset.filter(created_at__lt=_start_of_day(date_to + timedelta(days=1)))
+    return queryset
+
+
+def order_rows(date_from=None, date_to=None, status=None):
+    """Строки заказов с позициями (по строке на позицию) в порядке id"""
+    orders = filter_by_created_date(Order.objects.all(), date_from, date_to)
+    if status:
+        orders = orders.filter(status=status)
+    rows = orders.order_by('id', 'items__id').values_list(*ORDER_COLUMNS.values())
+    return rows.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def product_rows(date_from=None, date_to=None, status=None):
+    """Строки товаров с названием категории в порядке id"""
+    products = filter_by_created_date(Product.objects.all(), date_from, date_to)
+    if status:
+        products = products.filter(is_available=PRODUCT_STATUSES[status])
+    rows = products.order_by('id').values_list(*PRODUCT_COLUMNS.values())
+    return rows.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: write() возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def csv_lines(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_cell(value) for value in row])
+
+
+def ndjson_lines(columns, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+def export_lines(kind, export_format, date_from=None, date_to=None, status=None):
+    """Генератор строк выгрузки kind ('orders' | 'products') в формате export_format"""
+    if kind == 'orders':
+        columns, rows = list(ORDER_COLUMNS), order_rows(date_from, date_to, status)
+    else:
+        columns, rows = list(PRODUCT_COLUMNS), product_rows(date_from, date_to, status)
+    if export_format == 'csv':
+        return csv_lines(columns, rows)
+    return ndjson_lines(columns, rows)
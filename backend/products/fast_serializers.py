@@ -0,0 +1,103 @@
+"""
+Быстрая сериализация списков только для чтения.
+
+Строки берутся через values() вместе с колонками категории и превращаются в словари
+без создания экземпляров моделей и ModelSerializer. Результат побайтно совпадает
+с ProductSerializer / CategorySerializer (те же ключи в том же порядке, те же форматы),
+это проверяется тестами.
+"""
+from functools import lru_cache
+
+from .models import Category, Product, Favorite
+
+CATEGORY_COLUMNS = ('id', 'name', 'description', 'slug', 'image', 'products_count')
+
+PRODUCT_COLUMNS = (
+    'id', 'name', 'description', 'slug', 'price', 'stock', 'image', 'is_available', 'is_featured',
+    'created_at', 'updated_at', 'category_id',
+) + tuple(f'category__{column}' for column in CATEGORY_COLUMNS if column != 'id')
+
+
+@lru_cache(maxsize=None)
+def _formatters():
+    # Берём поля у самих сериализаторов, чтобы форматы цены и дат гарантированно совпадали
+    from .serializers import ProductSerializer
+    fields = ProductSerializer().fields
+    return fields['price'].to_representation, fields['created_at'].to_representation
+
+
+def _image_url(name, storage, request):
+    if not name:
+        return None
+    url = storage.url(name)
+    if request:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def product_values(queryset):
+    return queryset.values(*PRODUCT_COLUMNS)
+
+
+def category_values(queryset):
+    return queryset.values(*CATEGORY_COLUMNS)
+
+
+def serialize_categories(rows, context):
+    request = context.get('request')
+    storage = Category._meta.get_field('image').storage
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'slug': row['slug'],
+            'image': _image_url(row['image'], storage, request),
+            'products_count': row['products_count'],
+        }
+        for row in rows
+    ]
+
+
+def serialize_products(rows, context):
+    """Список словарей в формате ProductSerializer из строк product_values()"""
+    request = context.get('request')
+    favorite_ids = context.get('favorite_ids')
+    if favorite_ids is None:
+        user = getattr(request, 'user', None)
+        favorite_ids = set()
+        if user is not None and user.is_authenticated:
+            favorite_ids = set(Favorite.objects.filter(user=user).values_list('product_id', flat=True))
+    format_price, format_datetime = _formatters()
+    product_storage = Product._meta.get_field('image').storage
+    category_storage = Category._meta.get_field('image').storage
+    categories = {}
+    data = []
+    for row in rows:
+        category_id = row['category_id']
+        category = categories.get(category_id)
+        if category is None:
+            category = categories[category_id] = {
+                'id': category_id,
+                'name': row['category__name'],
+                'description': row['category__description'],
+                'slug': row['category__slug'],
+                'image': _image_url(row['category__image'], category_storage, request),
+                'products_count': row['category__products_count'],
+            }
+        data.append({
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'slug': row['slug'],
+            'category': category,
+            'price': format_price(row['price']),
+            'stock': row['stock'],
+            'image': _image_url(row['image'], product_storage, request),
+            'is_available': row['is_available'],
+            'is_featured': row['is_featured'],
+            'created_at': format_datetime(row['created_at']),
+            'updated_at': format_datetime(row['updated_at']),
+            'is_favorited': row['id'] in favorite_ids,
+        })
+    return data
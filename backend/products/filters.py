@@ -0,0 +1,81 @@
+import django_filters
+from django.db.models import Count, Q
+
+from .models import Product
+
+# Наибольший id (bigint): больший база не примет — OverflowError вместо пустого ответа
+MAX_ID = 2 ** 63 - 1
+
+
+def parse_id(value):
+    """id из параметра запроса или None, если это не положительное целое в пределах bigint"""
+    # isascii: isdigit() пропускает и '²', которое int() не разберёт
+    if value.isascii() and value.isdigit() and 0 < int(value) <= MAX_ID:
+        return int(value)
+    return None
+
+
+class ProductFilter(django_filters.FilterSet):
+    """Фильтры каталога: ?category=<slug|id>&min_price=&max_price=&in_stock=true&featured=true"""
+    category = django_filters.CharFilter(method='filter_category')
+    min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+    in_stock = django_filters.BooleanFilter(method='filter_in_stock')
+    featured = django_filters.BooleanFilter(field_name='is_featured')
+
+    class Meta:
+        model = Product
+        fields = []
+
+    def filter_category(self, queryset, name, value):
+        category_id = parse_id(value)
+        if category_id is not None:
+            return queryset.filter(category_id=category_id)
+        return queryset.filter(category__slug=value)
+
+    def filter_in_stock(self, queryset, name, value):
+        if value:
+            return queryset.filter(stock__gt=0)
+        return queryset.filter(stock=0)
+
+
+# Границы ценовых корзин фасета: [0, 100), [100, 500), ..., [5000, ∞)
+PRICE_BUCKETS = [0, 100, 500, 1000, 5000]
+
+
+def product_facets(queryset, params):
+    """Фасеты для текущего фильтра: товары по категориям и по ценовым корзинам.
+
+    Каждый фасет считается без собственного фильтра (счётчики категорий — без ?category=,
+    цены — без ?min_price/?max_price), чтобы клиент видел, сколько товаров даст другой выбор.
+    Всего два сгруппированных запроса независимо от числа категорий и корзин.
+    """
+    def filtered_without(*names):
+        data = params.copy()
+        for name in names:
+            data.pop(name, None)
+        return ProductFilter(data, queryset=queryset).qs.order_by()
+
+    categories = (
+        filtered_without('category')
+        .values('category_id', 'category__slug', 'category__name')
+        .annotate(count=Count('id'))
+        .order_by('category__name')
+    )
+
+    bounds = list(zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + [None]))
+    buckets = filtered_without('min_price', 'max_price').aggregate(**{
+        f'bucket_{i}': Count('id', filter=Q(price__gte=low) & (Q(price__lt=high) if high is not None else Q()))
+        for i, (low, high) in enumerate(bounds)
+    })
+
+    return {
+        'categories': [
+            {'id': row['category_id'], 'slug': row['category__slug'], 'name': row['category__name'], 'count': row['count']}
+            for row in categories
+        ],
+        'price': [
+            {'min': low, 'max': high, 'count': buckets[f'bucket_{i}']}
+            for i, (low, high) in enumerate(bounds)
+        ],
+    }
@@ -0,0 +1,72 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from products.benchmarks import benchmark_database, create_synthetic_catalog
+from products.cart import add_item
+from products.models import Cart, CartItem, Product
+from users.models import CustomUser
+
+
+def legacy_add_item(cart, product_id, quantity):
+    """Прежний CartAddItemView: чтение товара, get_or_create, += в Python и cart.save()"""
+    product = Product.objects.get(id=product_id, is_available=True)
+    if product.stock < quantity:
+        raise ValueError('Недостаточно товара на складе')
+    cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product, defaults={'quantity': quantity})
+    if not created:
+        cart_item.quantity += quantity
+        cart_item.save()
+    cart.save()
+
+
+class Command(BaseCommand):
+    help = 'Параллельные добавления одного товара в корзину: изменений в секунду и потерянные прибавления'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--adds', type=int, default=200, help='Добавлений на поток')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            create_synthetic_catalog(100, categories=1)
+            product = Product.objects.filter(is_available=True).first()
+            Product.objects.filter(pk=product.pk).update(stock=10 ** 9)
+            user = CustomUser.objects.create_user(email='bench@example.com', password='bench', username='bench')
+            for label, func in (('get_or_create + save()', legacy_add_item), ('upsert с F() (products/cart.py)', add_item)):
+                CartItem.objects.all().delete()
+                cart = Cart.objects.create(user=user)
+                self.run(label, func, cart, product.id, options)
+
+    def run(self, label, func, cart, product_id, options):
+        retries = []
+
+        def worker():
+            try:
+                for _ in range(options['adds']):
+                    # Общая база SQLite в памяти отвечает «table is locked» вместо ожидания — повторяем
+                    while True:
+                        try:
+                            func(cart, product_id, 1)
+                            break
+                        except OperationalError:
+                            retries.append(1)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        expected = options['threads'] * options['adds']
+        quantity = CartItem.objects.filter(cart=cart).values_list('quantity', flat=True).first() or 0
+        self.stdout.write(
+            f'{label:<34} {expected / elapsed:8.0f} изменений/с, '
+            f'итог {quantity} из {expected} (потеряно {expected - quantity}), повторов {len(retries)}'
+        )
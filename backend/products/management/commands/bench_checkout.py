@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+
+from products.benchmarks import benchmark_database, create_synthetic_catalog
+from products.cart import checkout
+from products.models import Cart, CartItem, Order, OrderItem, Product
+from users.models import CustomUser
+
+
+def legacy_checkout(user, shipping_address, phone, notes=''):
+    """Прежний OrderViewSet.create: без транзакции и списания остатков, OrderItem по одному"""
+    cart = Cart.objects.get(user=user)
+    order = Order.objects.create(user=user, total_price=cart.total_price, shipping_address=shipping_address,
+                                 phone=phone, notes=notes)
+    for cart_item in cart.items.all():
+        OrderItem.objects.create(order=order, product=cart_item.product, quantity=cart_item.quantity,
+                                 price=cart_item.product.price)
+    cart.items.all().delete()
+    cart.save()
+    return order
+
+
+class Command(BaseCommand):
+    help = 'Пропускная способность оформления заказа в зависимости от числа позиций'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 50])
+        parser.add_argument('--orders', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            create_synthetic_catalog(1000, categories=10)
+            Product.objects.update(stock=10 ** 9, is_available=True)
+            user = CustomUser.objects.create_user(email='bench@example.com', password='bench', username='bench')
+            cart = Cart.objects.create(user=user)
+            products = list(Product.objects.values_list('id', flat=True)[:max(options['lines'])])
+            for lines in options['lines']:
+                for label, func in (('поштучно, без транзакции', legacy_checkout), ('bulk в транзакции', checkout)):
+                    self.run(label, func, user, cart, products[:lines], options['orders'])
+
+    def run(self, label, func, user, cart, products, orders):
+        def fill():
+            CartItem.objects.bulk_create(CartItem(cart=cart, product_id=pk, quantity=1) for pk in products)
+
+        fill()
+        # При DEBUG=True журнал запросов копится и ограничен 9000 записей — очищаем перед замером
+        reset_queries()
+        with CaptureQueriesContext(connection) as ctx:
+            func(user, 'Минск', '+375291234567')
+        queries = len(ctx.captured_queries)
+
+        elapsed = 0.0
+        for _ in range(orders):
+            fill()
+            reset_queries()
+            start = time.perf_counter()
+            func(user, 'Минск', '+375291234567')
+            elapsed += time.perf_counter() - start
+        self.stdout.write(
+            f'{len(products):>3} позиций, {label:<26} {orders / elapsed:8.0f} заказов/с, {queries} запросов на заказ'
+        )
@@ -0,0 +1,60 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from products.benchmarks import benchmark_database, create_synthetic_catalog
+from products.fast_serializers import product_values, serialize_products
+from products.models import Product
+from products.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает ProductSerializer и быстрый путь на values(): строк в секунду и пик памяти'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20_000)
+        parser.add_argument('--page-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            create_synthetic_catalog(options['products'])
+            self.run(options)
+
+    def run(self, options):
+        request = Request(APIRequestFactory().get('/api/products/'))
+        queryset = Product.objects.filter(is_available=True).select_related('category')
+        total = queryset.count()
+        page_size = options['page_size']
+
+        def model_serializer(offset):
+            page = queryset[offset:offset + page_size]
+            context = {'request': request, 'favorite_ids': set()}
+            return JSONRenderer().render(ProductSerializer(page, many=True, context=context).data)
+
+        def fast_path(offset):
+            page = product_values(queryset)[offset:offset + page_size]
+            context = {'request': request, 'favorite_ids': set()}
+            return JSONRenderer().render(serialize_products(page, context))
+
+        if model_serializer(0) != fast_path(0):
+            self.stderr.write(self.style.ERROR('Ответы не совпадают побайтно'))
+
+        for label, func in (('ProductSerializer', model_serializer), ('values() + serialize_products', fast_path)):
+            start = time.perf_counter()
+            for offset in range(0, total, page_size):
+                func(offset)
+            elapsed = time.perf_counter() - start
+
+            # tracemalloc сильно замедляет выполнение, поэтому память меряем отдельным проходом по одной странице
+            tracemalloc.start()
+            func(0)
+            _current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(
+                f'{label:<32} {total / elapsed:10.0f} строк/с, пик памяти на страницу {peak / 1024:8.1f} КиБ '
+                f'(страницы по {page_size})'
+            )
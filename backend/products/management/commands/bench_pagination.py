@@ -0,0 +1,54 @@
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from products.benchmarks import benchmark_database, create_synthetic_catalog, measure
+from products.models import Product
+from products.pagination import ProductPagination, ProductCursorPagination
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает постраничную и курсорную пагинацию товаров на синтетическом каталоге'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500_000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--pages', type=int, nargs='+', default=[1, 1000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.stdout.write(f"Создаём каталог из {options['products']} товаров...")
+            create_synthetic_catalog(options['products'])
+            self.run(options)
+
+    def run(self, options):
+        factory = APIRequestFactory()
+        queryset = Product.objects.filter(is_available=True).select_related('category')
+        page_size = options['page_size']
+
+        def paginate(paginator_class, params):
+            request = Request(factory.get('/api/products/', params))
+            paginator = paginator_class()
+            page = paginator.paginate_queryset(queryset, request)
+            return paginator, page
+
+        for page_number in options['pages']:
+            offset_ms = measure(
+                lambda: paginate(ProductPagination, {'page': page_number, 'page_size': page_size}),
+                options['repeat'],
+            )
+
+            # До нужной страницы курсор доходит по ссылкам next, замеряем только последнюю
+            params = {'pagination': 'cursor', 'page_size': page_size}
+            for _ in range(page_number - 1):
+                paginator, _page = paginate(ProductCursorPagination, params)
+                next_query = parse_qs(urlparse(paginator.get_next_link()).query)
+                params = {**params, 'cursor': next_query['cursor'][0]}
+            cursor_ms = measure(lambda: paginate(ProductCursorPagination, params), options['repeat'])
+
+            self.stdout.write(
+                f'Страница {page_number:>6}: page number {offset_ms:8.2f} мс, cursor {cursor_ms:8.2f} мс'
+            )
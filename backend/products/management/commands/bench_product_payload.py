@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from products.benchmarks import benchmark_database, create_synthetic_catalog, measure
+from products.models import Product
+from products.serializers import ProductListSerializer, ProductSerializer
+
+
+class Command(BaseCommand):
+    help = 'Размер ответа и время сериализации страницы товаров: все поля против ?fields='
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10_000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--fields', default='id,name,price,image,stock')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            create_synthetic_catalog(options['products'])
+            self.run(options)
+
+    def run(self, options):
+        request = Request(APIRequestFactory().get('/api/products/', {'fields': options['fields']}))
+        context = {'request': request, 'favorite_ids': set()}
+        queryset = Product.objects.filter(is_available=True).select_related('category')
+        page_size = options['page_size']
+        fields, expand = ProductListSerializer.parse_fields(request.query_params)
+
+        def full():
+            page = list(queryset[:page_size])
+            return JSONRenderer().render(ProductSerializer(page, many=True, context=dict(context)).data)
+
+        def sparse():
+            page = list(ProductListSerializer.select_columns(queryset, fields, expand)[:page_size])
+            serializer = ProductListSerializer(page, many=True, context=dict(context), fields=fields, expand=expand)
+            return JSONRenderer().render(serializer.data)
+
+        for label, func in (('все поля', full), (f'fields={options["fields"]}', sparse)):
+            size = len(func())
+            elapsed = measure(func, options['repeat'])
+            self.stdout.write(f'{label:<40} {size:>8} байт {elapsed:8.2f} мс на {page_size} товаров')
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.benchmarks import benchmark_database, create_synthetic_catalog, measure
+from products.search import orm_search_queryset
+from products.search_index import ProductSearchIndex
+
+QUERIES = ['кубик', 'lego brick', 'шест', 'синий круглый набор']
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает поиск через OR из icontains и индекс в памяти на каталогах разного размера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--page-size', type=int, default=9)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            with benchmark_database():
+                create_synthetic_catalog(size)
+                self.run(size, options)
+
+    def run(self, size, options):
+        page_size = options['page_size']
+        index = ProductSearchIndex()
+        start = time.perf_counter()
+        index.build()
+        build_ms = (time.perf_counter() - start) * 1000
+        self.stdout.write(f'\n{size} товаров, индекс построен за {build_ms:.0f} мс')
+
+        for query in QUERIES:
+            def orm():
+                # Как раньше в ProductViewSet.search: COUNT пагинатора и первая страница
+                products = orm_search_queryset(query)
+                return products.count(), list(products[:page_size])
+
+            def indexed():
+                ids = index.search(query)
+                return len(ids), ids[:page_size]
+
+            orm_count = orm()[0]
+            index_count = indexed()[0]
+            orm_ms = measure(orm, options['repeat'])
+            index_ms = measure(indexed, options['repeat'])
+            self.stdout.write(
+                f'  {query!r:<24} ORM {orm_ms:9.2f} мс ({orm_count} найдено), '
+                f'индекс {index_ms:9.2f} мс ({index_count} найдено)'
+            )
@@ -0,0 +1,67 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.benchmarks import WORDS, benchmark_database, create_synthetic_catalog
+from products.search_index import ProductSearchIndex, normalize
+from products.trigram_index import NameTrigramIndex
+
+
+def make_typo(word, rng):
+    """Одна опечатка: пропуск, замена, вставка или перестановка соседних букв"""
+    position = rng.randrange(len(word))
+    letter = rng.choice('абвгдеиклмнопрстуaeiklnorst')
+    kind = rng.choice(('delete', 'replace', 'insert', 'swap'))
+    if kind == 'delete':
+        return word[:position] + word[position + 1:]
+    if kind == 'replace':
+        return word[:position] + letter + word[position + 1:]
+    if kind == 'insert':
+        return word[:position] + letter + word[position:]
+    position = min(position, len(word) - 2)
+    return word[:position] + word[position + 1] + word[position] + word[position + 2:]
+
+
+class Command(BaseCommand):
+    help = 'Полнота и задержка поиска с опечатками по триграммному индексу на синтетическом каталоге'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+        parser.add_argument('--queries', type=int, default=500)
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            with benchmark_database():
+                create_synthetic_catalog(size)
+                self.run(size, options)
+
+    def run(self, size, options):
+        exact = ProductSearchIndex()
+        exact.build()
+        index = NameTrigramIndex()
+        start = time.perf_counter()
+        index.build()
+        build_ms = (time.perf_counter() - start) * 1000
+        self.stdout.write(f'\n{size} товаров, {len(index.words)} слов, '
+                          f'{len(index.trigrams)} триграмм, построен за {build_ms:.0f} мс')
+
+        rng = random.Random(1)
+        words = [normalize(word) for word in WORDS if len(word) > 3]
+        recalls = []
+        timings = []
+        for _ in range(options['queries']):
+            word = rng.choice(words)
+            typo = make_typo(word, rng)
+            # Эталон — товары, у которых исправленное слово есть в названии
+            expected = {pk for pk in exact.search(word) if word in index.documents.get(pk, ())}
+            start = time.perf_counter()
+            found = index.search(typo)
+            timings.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(expected.intersection(found)) / len(expected) if expected else 1.0)
+
+        timings.sort()
+        self.stdout.write(
+            f'  полнота {sum(recalls) / len(recalls):.1%}, '
+            f'p50 {timings[len(timings) // 2]:.2f} мс, p99 {timings[int(len(timings) * 0.99) - 1]:.2f} мс'
+        )
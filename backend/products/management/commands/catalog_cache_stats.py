@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from products.cache import get_cache_stats, reset_cache_stats
+from products.search_cache import get_search_cache
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания/промахи кэша ответов каталога и кэша результатов поиска'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счётчики после вывода')
+
+    def handle(self, *args, **options):
+        stats = get_cache_stats()
+        self.stdout.write(f"Версия каталога: {stats['version']}")
+        self.stdout.write(f"Попадания: {stats['hits']}")
+        self.stdout.write(f"Промахи: {stats['misses']}")
+        self.stdout.write(f"Доля попаданий: {stats['hit_rate']:.1%}")
+        # Кэш поиска живёт в памяти процесса, здесь видна только статистика этого процесса
+        search = get_search_cache().stats()
+        self.stdout.write(f"Поиск: {search['entries']}/{search['max_entries']} запросов в кэше, "
+                          f"доля попаданий {search['hit_rate']:.1%}, вытеснено {search['evictions']}, "
+                          f"истекло {search['expirations']}")
+        if options['reset']:
+            reset_cache_stats()
+            get_search_cache().reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счётчики обнулены'))
@@ -0,0 +1,66 @@
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from products.models import Product, CartItem, Order, Favorite, OrderItem
+from products.views import ProductViewSet
+
+
+def endpoint_queries():
+    """Основные запросы эндпоинтов в том виде, в каком их строят views.py"""
+    products = ProductViewSet.queryset.all()
+    cursor_position = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return [
+        ('GET /api/products/ (COUNT)', lambda: products.count()),
+        ('GET /api/products/ (страница)', lambda: list(products[900:909])),
+        ('GET /api/products/?pagination=cursor',
+         lambda: list(products.filter(created_at__lt=cursor_position).order_by('-created_at', 'id')[:10])),
+        ('GET /api/products/{id}/', lambda: list(products.filter(pk=1))),
+        ('GET /api/categories/{id}/products/ (COUNT)', lambda: products.filter(category_id=1).count()),
+        ('GET /api/categories/{id}/products/ (страница)', lambda: list(products.filter(category_id=1)[:9])),
+        ('Рекомендуемые товары', lambda: list(products.filter(is_featured=True)[:9])),
+        ('Досинхронизация поискового индекса',
+         lambda: list(Product.objects.filter(updated_at__gte=cursor_position).order_by().values_list('id', 'name'))),
+        ('GET /api/cart/ (элементы)', lambda: list(CartItem.objects.filter(cart_id=1).select_related('product'))),
+        ('GET /api/favorites/', lambda: list(Favorite.objects.filter(user_id=1))),
+        ('GET /api/orders/', lambda: list(Order.objects.filter(user_id=1))),
+        ('GET /api/orders/ (элементы)', lambda: list(OrderItem.objects.filter(order_id__in=[1, 2, 3]))),
+    ]
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+
+def full_scans(plan):
+    """Строки плана с полным проходом по таблице (SQLite: SCAN без индекса, PostgreSQL: Seq Scan)"""
+    return [
+        line.strip() for line in plan.splitlines()
+        if ('SCAN ' in line and 'USING' not in line) or 'Seq Scan' in line
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Выполняет EXPLAIN для основных запросов эндпоинтов и падает, если есть полный проход по таблице'
+
+    def handle(self, *args, **options):
+        failures = []
+        for label, run_query in endpoint_queries():
+            # Выполняем запрос, чтобы получить ровно тот SQL, который строит ORM (в т.ч. для COUNT)
+            with CaptureQueriesContext(connection) as ctx:
+                run_query()
+            plan = '\n'.join(explain(query['sql']) for query in ctx.captured_queries)
+            scans = full_scans(plan)
+            marker = self.style.ERROR('FULL SCAN') if scans else self.style.SUCCESS('OK')
+            self.stdout.write(f'{marker} {label}')
+            if options['verbosity'] > 1 or scans:
+                for line in plan.splitlines():
+                    self.stdout.write(f'    {line}')
+            if scans:
+                failures.append(label)
+        if failures:
+            raise CommandError(f'Полный проход по таблице ({connection.vendor}): {", ".join(failures)}')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.export import EXPORT_FORMATS, EXPORT_STATUSES, export_lines
+from products.serializers import ExportFilterSerializer
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка заказов или товаров в CSV/NDJSON (в файл или stdout)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORT_STATUSES))
+        parser.add_argument('--format', dest='export_format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--from', dest='date_from', help='Начало периода по дате создания, YYYY-MM-DD')
+        parser.add_argument('--to', dest='date_to', help='Конец периода включительно, YYYY-MM-DD')
+        parser.add_argument('--status', help="Статус заказа или available/hidden для товаров")
+        parser.add_argument('--output', help='Путь к файлу (по умолчанию stdout)')
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        data = {name: options[name] for name in ('date_from', 'date_to', 'status') if options[name]}
+        filters = ExportFilterSerializer(data=data, context={'statuses': EXPORT_STATUSES[kind]})
+        if not filters.is_valid():
+            raise CommandError(filters.errors)
+        lines = export_lines(kind, options['export_format'], **filters.validated_data)
+
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        count = 0
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for line in lines:
+                output.write(line)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(f"Записано строк: {count} -> {options['output']}"))
@@ -0,0 +1,21 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.sales import rebuild_sales_rollup
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневные сводки продаж по заказам (за период или за всё время)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='Первый день, YYYY-MM-DD')
+        parser.add_argument('--to', dest='date_to', help='Последний день включительно, YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        try:
+            days = {name: date.fromisoformat(options[name]) for name in ('date_from', 'date_to') if options[name]}
+        except ValueError as e:
+            raise CommandError(f'Неверная дата: {e}')
+        rows = rebuild_sales_rollup(**days)
+        self.stdout.write(self.style.SUCCESS(f'Строк сводок: {rows}'))
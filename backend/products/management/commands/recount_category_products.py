@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Category
+from products.signals import recount_category_products
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованный счётчик доступных товаров у категорий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help='Slug категорий (по умолчанию — все)')
+
+    def handle(self, *args, **options):
+        categories = Category.objects.all()
+        if options['slugs']:
+            categories = categories.filter(slug__in=options['slugs'])
+        updated = recount_category_products(categories)
+        self.stdout.write(self.style.SUCCESS(f'Исправлено категорий: {updated}'))
@@ -0,0 +1,50 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.benchmarks import WORDS, benchmark_database, create_synthetic_catalog
+from products.suggest import SuggestIndex
+
+
+class Command(BaseCommand):
+    help = 'Показывает память индекса автодополнения и задержку подсказок (p50/p99)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--synthetic', type=int, metavar='N',
+                            help='Построить индекс на временной базе с N синтетическими товарами')
+        parser.add_argument('--queries', type=int, default=2000, help='Сколько префиксов замерить')
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            with benchmark_database():
+                create_synthetic_catalog(options['synthetic'])
+                self.run(options)
+        else:
+            self.run(options)
+
+    def run(self, options):
+        index = SuggestIndex()
+        start = time.perf_counter()
+        index.build()
+        build_ms = (time.perf_counter() - start) * 1000
+
+        footprint = index.memory_footprint()
+        self.stdout.write(f'Ключей: {len(index.keys)}, категорий-ключей: {len(index.categories)}, '
+                          f'построен за {build_ms:.0f} мс')
+        for part in ('keys', 'ids', 'categories', 'total'):
+            self.stdout.write(f'  {part:<10} {footprint[part] / 1024 / 1024:10.1f} МиБ')
+
+        # Префиксы длиной 1–6 символов, как при наборе в строке поиска
+        rng = random.Random(1)
+        prefixes = [rng.choice(WORDS)[:rng.randint(1, 6)] for _ in range(options['queries'])]
+        timings = []
+        for prefix in prefixes:
+            start = time.perf_counter()
+            index.suggest(prefix)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p50 = timings[len(timings) // 2]
+        p99 = timings[int(len(timings) * 0.99) - 1]
+        self.stdout.write(f'Подсказки ({len(timings)} префиксов): p50 {p50:.2f} мс, p99 {p99:.2f} мс, '
+                          f'max {timings[-1]:.2f} мс')
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:24
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_products_count(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    Product = apps.get_model('products', 'Product')
+    available = (
+        Product.objects.filter(category=OuterRef('pk'), is_available=True)
+        .order_by()
+        .values('category')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    Category.objects.update(products_count=Coalesce(Subquery(available), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_order_orderitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='products_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Доступных товаров'),
+        ),
+        migrations.RunPython(fill_products_count, migrations.RunPython.noop),
+    ]
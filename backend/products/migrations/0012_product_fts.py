@@ -0,0 +1,64 @@
+"""
+FTS5-таблица для поиска товаров (только SQLite).
+
+Таблица хранит собственную копию name/description, синхронизируется триггерами
+на products_product. «ё» заменяется на «е» при записи, как и в products/search_index.py:
+токенизатор unicode61 складывает регистр, но не считает «ё» вариантом «е».
+"""
+from django.db import migrations
+
+FOLD = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+
+CREATE_SQL = [
+    "CREATE VIRTUAL TABLE products_product_fts USING fts5("
+    "name, description, tokenize='unicode61 remove_diacritics 2')",
+    f"""
+    CREATE TRIGGER products_product_fts_insert AFTER INSERT ON products_product BEGIN
+        INSERT INTO products_product_fts(rowid, name, description)
+        VALUES (new.id, {FOLD.format('new.name')}, {FOLD.format('new.description')});
+    END
+    """,
+    """
+    CREATE TRIGGER products_product_fts_delete AFTER DELETE ON products_product BEGIN
+        DELETE FROM products_product_fts WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER products_product_fts_update AFTER UPDATE OF name, description ON products_product BEGIN
+        UPDATE products_product_fts
+        SET name = {FOLD.format('new.name')}, description = {FOLD.format('new.description')}
+        WHERE rowid = new.id;
+    END
+    """,
+    f"""
+    INSERT INTO products_product_fts(rowid, name, description)
+    SELECT id, {FOLD.format('name')}, {FOLD.format('description')} FROM products_product
+    """,
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS products_product_fts_insert',
+    'DROP TRIGGER IF EXISTS products_product_fts_delete',
+    'DROP TRIGGER IF EXISTS products_product_fts_update',
+    'DROP TABLE IF EXISTS products_product_fts',
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_updated_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_SQL), run_on_sqlite(DROP_SQL)),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_product_snapshot(apps, schema_editor):
+    OrderItem = apps.get_model('products', 'OrderItem')
+    Product = apps.get_model('products', 'Product')
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    OrderItem.objects.filter(product__isnull=False).update(
+        product_name=Subquery(product.values('name')[:1]),
+        product_slug=Subquery(product.values('slug')[:1]),
+        product_image=Coalesce(Subquery(product.values('image')[:1]), Value('')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_product_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_image',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Изображение товара'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, max_length=200, verbose_name='Название товара'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_slug',
+            field=models.SlugField(blank=True, db_index=False, verbose_name='URL товара'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='products.product', verbose_name='Товар'),
+        ),
+        migrations.RunPython(fill_product_snapshot, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:20
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def fill_rollups(apps, schema_editor):
+    Order = apps.get_model('products', 'Order')
+    OrderItem = apps.get_model('products', 'OrderItem')
+    Product = apps.get_model('products', 'Product')
+    DailyOrderTotals = apps.get_model('products', 'DailyOrderTotals')
+    DailySales = apps.get_model('products', 'DailySales')
+    money = models.DecimalField(max_digits=14, decimal_places=2)
+
+    def revenue(prefix=''):
+        return Coalesce(Sum(F(f'{prefix}price') * F(f'{prefix}quantity'), output_field=money),
+                        Value(Decimal('0.00')), output_field=money)
+
+    category = Product.objects.filter(pk=OuterRef('product_id')).values('category_id')[:1]
+    OrderItem.objects.filter(product__isnull=False).update(category_id=Subquery(category))
+
+    totals = (
+        Order.objects.order_by()
+        .values('status', day=TruncDate('created_at'))
+        .annotate(orders=Count('id', distinct=True), units=Coalesce(Sum('items__quantity'), 0),
+                  revenue=revenue('items__'))
+    )
+    DailyOrderTotals.objects.bulk_create((DailyOrderTotals(**row) for row in totals.iterator()), batch_size=2000)
+    sales = (
+        OrderItem.objects.order_by()
+        .values('product_id', 'category_id', 'order__status', day=TruncDate('order__created_at'))
+        .annotate(orders=Count('id'), units=Sum('quantity'), revenue=revenue())
+    )
+    DailySales.objects.bulk_create(
+        (DailySales(status=row.pop('order__status'), **row) for row in sales.iterator()), batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_orderitem_product_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.category', verbose_name='Категория товара'),
+        ),
+        migrations.CreateModel(
+            name='DailyOrderTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('status', models.CharField(choices=[('оформлен', 'Оформлен'), ('оплачен', 'Оплачен'), ('отправлен', 'Отправлен')], max_length=20, verbose_name='Статус заказа')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+                ('units', models.IntegerField(default=0, verbose_name='Единиц товара')),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Выручка')),
+            ],
+            options={
+                'verbose_name': 'Продажи за день',
+                'verbose_name_plural': 'Продажи за день',
+                'ordering': ['-day', 'status'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'status'), name='daily_totals_day_status_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('status', models.CharField(choices=[('оформлен', 'Оформлен'), ('оплачен', 'Оплачен'), ('отправлен', 'Отправлен')], max_length=20, verbose_name='Статус заказа')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+                ('units', models.IntegerField(default=0, verbose_name='Единиц товара')),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Выручка')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.category', verbose_name='Категория')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Продажи товара за день',
+                'verbose_name_plural': 'Продажи товаров за день',
+                'ordering': ['-day', 'status'],
+                'constraints': [models.UniqueConstraint(models.F('day'), models.F('status'), django.db.models.functions.comparison.Coalesce('product', models.Value(0)), django.db.models.functions.comparison.Coalesce('category', models.Value(0)), name='daily_sales_key_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
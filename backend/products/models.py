@@ -1,6 +1,8 @@
 from django.db import models
 from django.conf import settings
 from django.core.validators import MinValueValidator
+from django.db.models import F, OuterRef, Prefetch, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from decimal import Decimal
 from users.models import CustomUser
 
@@ -12,6 +14,8 @@ class Category(models.Model):
     slug = models.SlugField(unique=True, verbose_name="URL")
     image = models.ImageField(upload_to='categories/', blank=True, null=True, verbose_name="Изображение")
     is_active = models.BooleanField(default=True, verbose_name="Активна")
+    # Денормализованный счётчик доступных товаров, поддерживается сигналами (products/signals.py)
+    products_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Доступных товаров")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
@@ -42,17 +46,66 @@ class Product(models.Model):
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
         ordering = ['-created_at']
+        indexes = [
+            # Ключ курсорной пагинации (ProductCursorPagination)
+            models.Index(fields=['-created_at', 'id'], name='product_created_id_idx'),
+            # Частичные индексы под запросы каталога: витрина показывает только доступные товары,
+            # а условие is_available=True Django передаёт в SQL без сравнения ("is_available"),
+            # поэтому обычный составной индекс с is_available первой колонкой не используется
+            models.Index(fields=['-created_at', 'id'], condition=models.Q(is_available=True),
+                         name='product_avail_created_idx'),
+            models.Index(fields=['category', '-created_at', 'id'], condition=models.Q(is_available=True),
+                         name='product_cat_avail_created_idx'),
+            models.Index(fields=['-created_at', 'id'], condition=models.Q(is_available=True, is_featured=True),
+                         name='product_featured_created_idx'),
+            # Досинхронизация поискового индекса (products/search_index.py)
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class DeletedProduct(models.Model):
+    """Отметка об удалении товара: по ней индексы поиска других процессов убирают товар"""
+    product_id = models.BigIntegerField(verbose_name="id товара")
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Дата удаления")
+
+    class Meta:
+        verbose_name = "Удалённый товар"
+        verbose_name_plural = "Удалённые товары"
+
+    def __str__(self):
+        return f"Товар #{self.product_id}"
+
+
+def _cart_totals(prefix=''):
+    """Выражения для итогов корзины: сумма quantity * price и количество товаров"""
+    return {
+        'items_total_price': Coalesce(
+            Sum(F(f'{prefix}quantity') * F(f'{prefix}product__price'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+            Value(Decimal('0.00')),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ),
+        'items_total_quantity': Coalesce(Sum(f'{prefix}quantity'), 0),
+    }
+
+
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Итоги корзины считает база (см. Cart.total_price / Cart.total_items)"""
+        return self.annotate(**_cart_totals('items__'))
+
+
 class Cart(models.Model):
     """Модель корзины покупок"""
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='carts', verbose_name="Пользователь")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
+    objects = CartQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Корзина"
         verbose_name_plural = "Корзины"
@@ -61,15 +114,24 @@ class Cart(models.Model):
     def __str__(self):
         return f"Корзина пользователя {self.user.username}"
 
+    def _load_totals(self):
+        # Без with_totals() — один агрегирующий запрос, результат запоминается на объекте
+        if not hasattr(self, 'items_total_price'):
+            totals = self.items.aggregate(**_cart_totals())
+            self.items_total_price = totals['items_total_price']
+            self.items_total_quantity = totals['items_total_quantity']
+
     @property
     def total_price(self):
         """Общая стоимость корзины"""
-        return sum(item.total_price for item in self.items.all())
+        self._load_totals()
+        return self.items_total_price
 
     @property
     def total_items(self):
         """Общее количество товаров в корзине"""
-        return sum(item.quantity for item in self.items.all())
+        self._load_totals()
+        return self.items_total_quantity
 
 
 class CartItem(models.Model):
@@ -84,6 +146,9 @@ class CartItem(models.Model):
         verbose_name_plural = "Элементы корзины"
         unique_together = ['cart', 'product']
         ordering = ['-added_at']
+        indexes = [
+            models.Index(fields=['cart', '-added_at'], name='cartitem_cart_added_idx'),
+        ]
 
     def __str__(self):
         return f"{self.quantity}x {self.product.name} в корзине {self.cart.user.username}"
@@ -108,6 +173,22 @@ class Favorite(models.Model):
         return f"{self.user.username} - {self.product.name}"
 
 
+class OrderQuerySet(models.QuerySet):
+    def with_items(self):
+        """Позиции заказов одним дополнительным запросом; каталог не читается — в позициях снимки товаров"""
+        return self.prefetch_related(Prefetch('items', queryset=OrderItem.objects.all()))
+
+    def with_summary(self):
+        """Для краткого списка: число товаров и картинка первой позиции считаются в том же запросе"""
+        items = OrderItem.objects.filter(order=OuterRef('pk')).order_by()
+        return self.annotate(
+            items_total_quantity=Coalesce(
+                Subquery(items.values('order').annotate(total=Sum('quantity')).values('total')), 0,
+            ),
+            first_item_image=Subquery(items.order_by('id').values('product_image')[:1]),
+        )
+
+
 class Order(models.Model):
     """Модель заказа"""
     STATUS_CHOICES = [
@@ -125,10 +206,15 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"Заказ #{self.id} - {self.user.username} ({self.get_status_display()})"
@@ -137,9 +223,17 @@ class Order(models.Model):
 class OrderItem(models.Model):
     """Модель элемента заказа"""
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items', verbose_name="Заказ")
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Товар")
+    # Товар может быть удалён из каталога — позиция остаётся со снимком ниже
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Товар")
     quantity = models.PositiveIntegerField(default=1, verbose_name="Количество")
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена за единицу")
+    # Снимок товара на момент оформления: история заказов не обращается к каталогу
+    product_name = models.CharField(max_length=200, blank=True, verbose_name="Название товара")
+    product_slug = models.SlugField(blank=True, db_index=False, verbose_name="URL товара")
+    product_image = models.CharField(max_length=100, blank=True, verbose_name="Изображение товара")
+    # Категория на момент оформления: ключ сводок продаж не меняется при переносе товара
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+                                 verbose_name="Категория товара")
     
     class Meta:
         verbose_name = "Элемент заказа"
@@ -147,9 +241,74 @@ class OrderItem(models.Model):
         ordering = ['id']
 
     def __str__(self):
-        return f"{self.quantity}x {self.product.name} в заказе #{self.order.id}"
+        return f"{self.quantity}x {self.product_name} в заказе #{self.order_id}"
+
+    def save(self, *args, **kwargs):
+        # Позиции, созданные не через checkout (например, в админке), тоже получают снимок и цену
+        if self.product_id and not self.product_name:
+            if self.price is None:
+                self.price = self.product.price
+            self.product_name = self.product.name
+            self.product_slug = self.product.slug
+            self.product_image = self.product.image.name or ''
+            self.category_id = self.product.category_id
+        super().save(*args, **kwargs)
 
     @property
     def total_price(self):
         """Общая стоимость элемента заказа"""
         return self.price * self.quantity
+
+
+class DailyOrderTotals(models.Model):
+    """Сводка заказов за день по статусу (products/sales.py)"""
+    day = models.DateField(verbose_name="День")
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name="Статус заказа")
+    orders = models.IntegerField(default=0, verbose_name="Заказов")
+    units = models.IntegerField(default=0, verbose_name="Единиц товара")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name="Выручка")
+
+    class Meta:
+        verbose_name = "Продажи за день"
+        verbose_name_plural = "Продажи за день"
+        ordering = ['-day', 'status']
+        constraints = [
+            # Ключ upsert в products/sales.py
+            models.UniqueConstraint(fields=['day', 'status'], name='daily_totals_day_status_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.orders} заказов"
+
+
+class DailySales(models.Model):
+    """Сводка продаж за день по товару, категории и статусу заказа (products/sales.py)
+
+    orders — число позиций заказов (заказов с этим товаром); строки удалённых товара
+    или категории складываются в строки с NULL.
+    """
+    day = models.DateField(verbose_name="День")
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name="Статус заказа")
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+                                verbose_name="Товар")
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+                                 verbose_name="Категория")
+    orders = models.IntegerField(default=0, verbose_name="Заказов")
+    units = models.IntegerField(default=0, verbose_name="Единиц товара")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name="Выручка")
+
+    class Meta:
+        verbose_name = "Продажи товара за день"
+        verbose_name_plural = "Продажи товаров за день"
+        ordering = ['-day', 'status']
+        constraints = [
+            # Ключ upsert в products/sales.py. Удалённые товар или категория — NULL, а NULL не равны
+            # друг другу; nulls_distinct=False SQLite не поддерживает, поэтому NULL сводится к 0
+            models.UniqueConstraint(
+                F('day'), F('status'), Coalesce('product', Value(0)), Coalesce('category', Value(0)),
+                name='daily_sales_key_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.status} товар #{self.product_id}: {self.units} шт."
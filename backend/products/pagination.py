@@ -1,7 +1,23 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 
 class ProductPagination(PageNumberPagination):
     """Пагинация для товаров"""
     page_size = 9
     page_size_query_param = 'page_size'
     max_page_size = 100
+
+
+class ProductCursorPagination(CursorPagination):
+    """Курсорная (keyset) пагинация для товаров: без COUNT(*) и OFFSET на глубоких страницах"""
+    page_size = 9
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', 'id')
+
+
+def get_product_paginator(request):
+    """Курсорная пагинация включается параметром ?pagination=cursor (или наличием ?cursor=)"""
+    params = request.query_params
+    if params.get('pagination') == 'cursor' or 'cursor' in params:
+        return ProductCursorPagination()
+    return ProductPagination()
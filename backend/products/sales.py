@@ -0,0 +1,222 @@
+"""
+Сводки продаж по дням для отчётов.
+
+DailyOrderTotals хранит заказы, единицы и выручку за день по статусу заказа,
+DailySales — то же в разрезе товара и категории. Сводки меняются приращениями
+вместе с заказом: при оформлении (checkout), при смене статуса и при удалении
+заказа (сигналы Order в products/signals.py). Отчёт за период читает только
+строки сводок за этот период, поэтому его стоимость не зависит от числа заказов.
+
+Каждая сводка пишется одним INSERT … ON CONFLICT DO UPDATE с приращением по
+уникальному ключу строки, поэтому параллельные заказы не создают дубликатов и
+не теряют прибавлений. Ключ строки DailySales берётся из самой позиции заказа
+(товар и снимок категории), поэтому вычитание при смене статуса попадает в ту
+же строку, что и прибавление при оформлении. Заказы и позиции, созданные или
+изменённые в админке, учитываются через record_order и order_items_changed
+(products/admin.py); после правок заказов в обход API и админки (shell, SQL)
+сводки нужно пересчитать командой rebuild_sales_rollup.
+
+orders в DailySales — число позиций заказов (у товара это число заказов с ним),
+поэтому строки сводок можно складывать: перед удалением товара или категории
+их строки переносятся в строки с NULL вместо id (fold_deleted).
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .export import filter_by_created_date
+from .models import DailyOrderTotals, DailySales, Order, OrderItem
+
+ROLLUP_FIELDS = ('orders', 'units', 'revenue')
+REPORT_GROUPS = ('day', 'product', 'category')
+
+_MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _revenue(prefix=''):
+    return Coalesce(Sum(F(f'{prefix}price') * F(f'{prefix}quantity'), output_field=_MONEY),
+                    Value(Decimal('0.00')), output_field=_MONEY)
+
+
+# Строк DailySales в одном INSERT (ограничение на число параметров запроса)
+UPSERT_BATCH_SIZE = 500
+
+_UPSERT_SQL = '''
+    INSERT INTO {table} ({columns}) VALUES {values}
+    ON CONFLICT ({key}) DO UPDATE SET
+    orders = {table}.orders + excluded.orders,
+    units = {table}.units + excluded.units,
+    revenue = {table}.revenue + excluded.revenue
+'''
+
+
+def order_buckets(lines):
+    """Позиции заказа, сложенные по ключу DailySales: {(товар, категория): [заказов, единиц, выручка]}
+
+    lines — кортежи (product_id, category_id, quantity, price).
+    """
+    buckets = defaultdict(lambda: [0, 0, Decimal('0.00')])
+    for product_id, category_id, quantity, price in lines:
+        bucket = buckets[product_id, category_id]
+        bucket[0] += 1
+        bucket[1] += quantity
+        bucket[2] += price * quantity
+    return buckets
+
+
+def _stored_buckets(order):
+    return order_buckets(OrderItem.objects.filter(order=order).values_list('product_id', 'category_id', 'quantity', 'price'))
+
+
+def _upsert(model, key, rows):
+    quote = connection.ops.quote_name
+    columns = [*(column for column, _expression in key), *ROLLUP_FIELDS]
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    sql = _UPSERT_SQL.format(
+        table=quote(model._meta.db_table),
+        columns=', '.join(quote(column) for column in columns),
+        values=', '.join([placeholders] * len(rows)),
+        key=', '.join(expression for _column, expression in key),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+
+
+# Столбцы ключа и выражения, совпадающие с уникальными ограничениями моделей
+_TOTALS_KEY = [('day', 'day'), ('status', 'status')]
+_SALES_KEY = [('day', 'day'), ('status', 'status'),
+              ('product_id', 'COALESCE(product_id, 0)'), ('category_id', 'COALESCE(category_id, 0)')]
+
+
+def _apply(order, status, buckets, sign):
+    day = timezone.localdate(order.created_at)
+    units = sum(bucket[1] for bucket in buckets.values())
+    revenue = sum((bucket[2] for bucket in buckets.values()), Decimal('0.00'))
+    _upsert(DailyOrderTotals, _TOTALS_KEY, [(day, status, sign, sign * units, sign * revenue)])
+    rows = [(day, status, product_id, category_id, sign * orders, sign * units, sign * revenue)
+            for (product_id, category_id), (orders, units, revenue) in buckets.items()]
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        _upsert(DailySales, _SALES_KEY, rows[start:start + UPSERT_BATCH_SIZE])
+
+
+def record_order(order, buckets):
+    """Учесть новый заказ; buckets — order_buckets() его позиций (checkout строит их из корзины)"""
+    _apply(order, order.status, buckets, 1)
+
+
+def move_order(order, old_status, new_status):
+    """Перенести заказ из сводок старого статуса в сводки нового"""
+    buckets = _stored_buckets(order)
+    # Вычитание и прибавление вместе: сбой между ними не должен оставить заказ вне сводок
+    with transaction.atomic():
+        _apply(order, old_status, buckets, -1)
+        _apply(order, new_status, buckets, 1)
+
+
+@contextmanager
+def order_items_changed(order_ids):
+    """Правка позиций заказов мимо checkout (админка): вклад заказов пересчитывается по позициям до и после"""
+    orders = list(Order.objects.filter(pk__in=order_ids))
+    before = {order.pk: _stored_buckets(order) for order in orders}
+    yield
+    with transaction.atomic():
+        for order in orders:
+            _apply(order, order.status, before[order.pk], -1)
+            _apply(order, order.status, _stored_buckets(order), 1)
+
+
+def forget_order(order):
+    """Вычесть заказ из сводок (до удаления его позиций)"""
+    _apply(order, order.status, _stored_buckets(order), -1)
+
+
+def fold_deleted(field, object_id):
+    """Перенести строки DailySales удаляемого товара (field='product') или категории в строки с NULL
+
+    Вызывается до удаления: SET_NULL сделал бы из строк (товар 1, категория) и
+    (товар 2, категория) две строки с одним ключом.
+    """
+    rows = DailySales.objects.filter(**{field: object_id})
+    folded = [
+        (day, status, None if field == 'product' else product_id, None if field == 'category' else category_id,
+         orders, units, revenue)
+        for day, status, product_id, category_id, orders, units, revenue in rows.values_list(
+            'day', 'status', 'product_id', 'category_id', *ROLLUP_FIELDS)
+    ]
+    if not folded:
+        return
+    with transaction.atomic():
+        rows.delete()
+        # Ключи перенесённых строк различны: у исходных отличалось всё, кроме обнуляемого поля
+        for start in range(0, len(folded), UPSERT_BATCH_SIZE):
+            _upsert(DailySales, _SALES_KEY, folded[start:start + UPSERT_BATCH_SIZE])
+
+
+def rebuild_sales_rollup(date_from=None, date_to=None, batch_size=2000):
+    """Пересчитать сводки за период (по умолчанию — за всё время) по заказам; возвращает число строк"""
+    orders = filter_by_created_date(Order.objects.all(), date_from, date_to)
+    days = Q()
+    if date_from:
+        days &= Q(day__gte=date_from)
+    if date_to:
+        days &= Q(day__lte=date_to)
+
+    totals = (
+        orders.order_by()
+        .values('status', day=TruncDate('created_at'))
+        .annotate(orders=Count('id', distinct=True), units=Coalesce(Sum('items__quantity'), 0),
+                  revenue=_revenue('items__'))
+    )
+    sales = (
+        OrderItem.objects.filter(order__in=orders).order_by()
+        .values('product_id', 'category_id', 'order__status', day=TruncDate('order__created_at'))
+        .annotate(orders=Count('id'), units=Sum('quantity'), revenue=_revenue())
+    )
+    with transaction.atomic():
+        DailyOrderTotals.objects.filter(days).delete()
+        DailySales.objects.filter(days).delete()
+        created = DailyOrderTotals.objects.bulk_create(
+            (DailyOrderTotals(**row) for row in totals.iterator(chunk_size=batch_size)), batch_size=batch_size,
+        )
+        count = len(created)
+        created = DailySales.objects.bulk_create(
+            (DailySales(status=row.pop('order__status'), **row) for row in sales.iterator(chunk_size=batch_size)),
+            batch_size=batch_size,
+        )
+        return count + len(created)
+
+
+def sales_report(date_from=None, date_to=None, status=None, group_by='day'):
+    """Продажи за период из сводок: по дням, товарам или категориям, сначала больше выручка (для дней — по дате)
+
+    В разрезе категорий числа заказов нет: сводки хранят его по товарам, и сумма
+    посчитала бы заказ с несколькими товарами категории несколько раз.
+    """
+    rows = DailyOrderTotals.objects.all() if group_by == 'day' else DailySales.objects.all()
+    if date_from:
+        rows = rows.filter(day__gte=date_from)
+    if date_to:
+        rows = rows.filter(day__lte=date_to)
+    if status:
+        rows = rows.filter(status=status)
+    # Имена аннотаций не должны совпадать с полями модели — переименовываем после выборки
+    sums = {f'total_{field}': Sum(field) for field in ROLLUP_FIELDS}
+    if group_by == 'day':
+        rows = rows.values('day').annotate(**sums).order_by('day')
+    elif group_by == 'product':
+        rows = rows.values('product_id', name=F('product__name')).annotate(**sums).order_by('-total_revenue')
+    else:
+        rows = rows.values('category_id', name=F('category__name')).annotate(**sums).order_by('-total_revenue')
+    # Строки, из которых все заказы ушли в другой статус, в отчёт не попадают
+    rows = rows.exclude(total_orders=0)
+    fields = [field for field in ROLLUP_FIELDS if not (group_by == 'category' and field == 'orders')]
+    return [
+        {**{key: value for key, value in row.items() if key not in sums},
+         **{field: row[f'total_{field}'] for field in fields}}
+        for row in rows
+    ]
@@ -0,0 +1,111 @@
+"""
+Поиск товаров: возвращает упорядоченный список id доступных товаров.
+
+Бэкенд выбирается настройкой PRODUCT_SEARCH_BACKEND:
+"index" — инвертированный индекс в памяти процесса с ранжированием BM25 (products/search_index.py),
+"fts" — FTS5-таблица SQLite с ранжированием bm25 (миграция 0012_product_fts),
+"orm" — прежний OR из icontains.
+
+Если точный поиск ничего не нашёл, запрос повторяется по триграммному индексу
+названий (products/trigram_index.py) — с учётом опечаток.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+from .search_index import get_product_index, tokenize
+from .trigram_index import get_trigram_index
+
+# Веса колонок для bm25: совпадение в названии важнее совпадения в описании
+FTS_WEIGHTS = (10.0, 1.0)
+
+
+def orm_search_queryset(query):
+    """Прежний поиск через OR из icontains/istartswith по названию (полный проход по таблице)"""
+    query = query.strip()
+    if not query:
+        return Product.objects.none()
+    q_objects = Q()
+    
+    # 1. Поиск по оригинальному запросу (как есть)
+    q_objects |= Q(name__icontains=query)
+    
+    # 2. Поиск по запросу в верхнем регистре
+    q_objects |= Q(name__icontains=query.upper())
+    
+    # 3. Поиск по запросу в нижнем регистре
+    q_objects |= Q(name__icontains=query.lower())
+    
+    # 4. Поиск по запросу с заглавной первой буквой
+    capitalized_query = query[0].upper() + query[1:].lower()
+    q_objects |= Q(name__icontains=capitalized_query)
+    
+    # 5. Поиск по началу названия (независимо от регистра)
+    q_objects |= Q(name__istartswith=query)
+    q_objects |= Q(name__istartswith=query.lower())
+    q_objects |= Q(name__istartswith=query.upper())
+    
+    # 6. Поиск по словам (независимо от регистра)
+    words = query.split()
+    for word in words:
+        if len(word) >= 2:
+            q_objects |= Q(name__icontains=word)
+            q_objects |= Q(name__icontains=word.lower())
+            q_objects |= Q(name__icontains=word.upper())
+    
+    return Product.objects.filter(is_available=True).filter(q_objects).distinct()
+
+
+def orm_search_ids(query):
+    return list(orm_search_queryset(query).values_list('id', flat=True))
+
+
+def fts_search_ids(query):
+    """Каждое слово — префиксный запрос FTS5, слова через AND; сначала самые релевантные по bm25"""
+    if connection.vendor != 'sqlite':
+        raise ImproperlyConfigured('PRODUCT_SEARCH_BACKEND="fts" работает только с SQLite')
+    terms = tokenize(query)
+    if not terms:
+        return []
+    # tokenize() оставляет только буквы, цифры и _, поэтому кавычки в терминах невозможны
+    match = ' AND '.join(f'"{term}"*' for term in terms)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT p.id FROM products_product_fts f '
+            'JOIN products_product p ON p.id = f.rowid '
+            'WHERE products_product_fts MATCH %s AND p.is_available '
+            'ORDER BY bm25(products_product_fts, %s, %s), p.stock DESC, p.is_featured DESC, p.created_at DESC, p.id',
+            [match, *FTS_WEIGHTS],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def index_search_ids(query):
+    return get_product_index().search(query)
+
+
+SEARCH_BACKENDS = {
+    'index': index_search_ids,
+    'fts': fts_search_ids,
+    'orm': orm_search_ids,
+}
+
+
+def search_product_ids(query):
+    """Упорядоченные id доступных товаров по запросу через бэкенд из настроек"""
+    backend = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'index')
+    try:
+        search = SEARCH_BACKENDS[backend]
+    except KeyError:
+        raise ImproperlyConfigured(f'Неизвестный PRODUCT_SEARCH_BACKEND: {backend!r}')
+    return search(query)
+
+
+def search_with_typo_fallback(query):
+    """(id, исправлено ли) — при пустом точном результате ищем похожие слова по триграммам"""
+    product_ids = search_product_ids(query)
+    if product_ids or not tokenize(query):
+        return product_ids, False
+    return get_trigram_index().search(query), True
@@ -0,0 +1,111 @@
+"""
+Кэш результатов поиска: упорядоченный список id товаров на нормализованный запрос.
+
+Запросы «Кубик», «кубик » и «КУБИК» дают один ключ, а все страницы выдачи
+нарезаются из одного списка. Кэш живёт в памяти процесса, ограничен по размеру
+(LRU) и по времени (TTL) и целиком сбрасывается при смене состояния каталога
+(products/sync.py), в том числе из-за изменений в других процессах.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .sync import get_catalog_state
+
+
+def normalize_query(query):
+    return ' '.join(query.casefold().split())
+
+
+class SearchResultCache:
+    def __init__(self, max_entries, timeout):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _check_version(self):
+        version = get_catalog_state()
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+    def get(self, key):
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._check_version()
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_search_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SearchResultCache(settings.SEARCH_RESULT_CACHE_SIZE, settings.SEARCH_RESULT_CACHE_TIMEOUT)
+    return _cache
+
+
+def cached_search(query, search):
+    """search(нормализованный запрос) -> (id, fuzzy); результат кэшируется по запросу и бэкенду поиска"""
+    query = normalize_query(query)
+    if not query:
+        # Запрос из одних пробелов: бэкенды поиска пустую строку не принимают
+        return [], False
+    key = (settings.PRODUCT_SEARCH_BACKEND, query)
+    cache = get_search_cache()
+    result = cache.get(key)
+    if result is None:
+        result = search(query)
+        cache.set(key, result)
+    return result
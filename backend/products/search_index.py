@@ -0,0 +1,306 @@
+"""
+Инвертированный индекс товаров в памяти процесса с ранжированием BM25.
+
+Название, название категории и описание доступных товаров разбиваются на токены
+(casefold, «ё» → «е», кириллица и латиница). Для каждого токена хранится словарь
+id товара -> вклад токена в документ: частоты по полям с весами FIELD_WEIGHTS,
+нормированные на длину поля (BM25F), уже пропущенные через насыщение k1. Поэтому
+при запросе остаётся умножить вклад на idf токена и сложить по словам запроса.
+
+Запрос отвечается пересечением (AND): каждое слово ищется как префикс токена по
+отсортированному словарю. Совпадение целого слова весит больше, чем продолжение
+префикса; товары, название которых начинается с первого слова запроса, получают
+надбавку. При равной релевантности выше товары с большим остатком, затем
+рекомендуемые, затем более новые.
+
+Индекс строится лениво при первом поиске. Изменения в этом процессе приходят
+через сигналы Product и Category (products/signals.py); изменения из других
+воркеров подтягиваются по смене состояния каталога (products/sync.py) — дозагрузкой
+товаров и категорий с updated_at не старше последней синхронизации. Удалённые
+товары по updated_at не найти: их id берутся из отметок DeletedProduct, которые
+пишет сигнал удаления и которые хранятся TOMBSTONE_RETENTION. Индекс, не
+синхронизированный дольше, строится заново.
+"""
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .sync import get_catalog_state
+from .models import Category, DeletedProduct, Product
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Запас на рассинхронизацию часов и длинные транзакции при дозагрузке изменений
+SYNC_OVERLAP = timedelta(minutes=5)
+# Сколько хранятся отметки об удалении товаров
+TOMBSTONE_RETENTION = timedelta(days=1)
+
+# Веса полей и параметры BM25
+FIELD_WEIGHTS = {'name': 3.0, 'category': 2.0, 'description': 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Токен, который только начинается со слова запроса, весит меньше точного совпадения
+PARTIAL_MATCH_WEIGHT = 0.5
+# Надбавка, если название начинается с первого слова запроса
+NAME_PREFIX_BOOST = 1.5
+
+INDEX_COLUMNS = ('id', 'name', 'description', 'category__name', 'stock', 'is_featured', 'created_at')
+
+
+def normalize(text):
+    return text.casefold().replace('ё', 'е')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+def deleted_product_ids(since):
+    """id товаров, удалённых начиная с since (в том числе другими процессами)"""
+    return DeletedProduct.objects.filter(deleted_at__gte=since).values_list('product_id', flat=True)
+
+
+def tombstones_expired(since):
+    """Отметки об удалениях после since уже могли быть подчищены — индекс надо строить заново"""
+    return since < timezone.now() - TOMBSTONE_RETENTION
+
+
+def sort_key(stock, is_featured, created_at, product_id):
+    """Порядок при равной релевантности одним целым: остаток, рекомендуемый, новее, меньший id"""
+    # По 64 бита на время в микросекундах и на id (bigint)
+    return ((stock << 129) | (is_featured << 128) | (int(created_at.timestamp() * 1_000_000) << 64)
+            | (2 ** 63 - 1 - product_id))
+
+
+class ProductSearchIndex:
+    """Индекс: токен -> {id товара: вклад}, плюс ключи сортировки для равной релевантности"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.postings = {}
+        self.vocabulary = []
+        self.documents = {}
+        self.sort_keys = {}
+        # Первое слово названия -> id товаров (надбавка за совпадение начала названия)
+        self.name_starts = {}
+        # Суммарные длины полей — для средней длины в нормировке BM25
+        self.field_lengths = dict.fromkeys(FIELD_WEIGHTS, 0)
+        self.version = None
+        self.synced_at = None
+
+    def __len__(self):
+        return len(self.documents)
+
+    def build(self, queryset=None):
+        """Полное построение индекса по доступным товарам"""
+        if queryset is None:
+            queryset = Product.objects.filter(is_available=True)
+        version = get_catalog_state()
+        synced_at = timezone.now()
+        rows = queryset.order_by().values_list(*INDEX_COLUMNS)
+        with self._lock:
+            self.version = None
+            self.postings = {}
+            self.documents = {}
+            self.sort_keys = {}
+            self.name_starts = {}
+            # Первый проход — только длины полей: средние нужны заранее, чтобы вклад первых
+            # товаров нормировался так же, как остальных
+            count = 0
+            self.field_lengths = dict.fromkeys(FIELD_WEIGHTS, 0)
+            for row in rows.iterator(chunk_size=2000):
+                count += 1
+                for field, tokens in self._fields(*row[1:4]).items():
+                    self.field_lengths[field] += len(tokens)
+            averages = {field: total / (count or 1) for field, total in self.field_lengths.items()}
+            for product_id, name, description, category_name, stock, is_featured, created_at in (
+                rows.iterator(chunk_size=2000)
+            ):
+                fields = self._fields(name, description, category_name)
+                self._add(product_id, fields, stock, is_featured, created_at, averages)
+            self.vocabulary = sorted(self.postings)
+            self.version = version
+            self.synced_at = synced_at
+
+    def refresh(self):
+        """Дозагрузка товаров, изменённых с последней синхронизации (в т.ч. другими процессами)"""
+        version = get_catalog_state()
+        if version == self.version:
+            return
+        synced_at = timezone.now()
+        since = self.synced_at - SYNC_OVERLAP
+        if tombstones_expired(since):
+            self.build()
+            return
+        with self._lock:
+            changed = Product.objects.filter(updated_at__gte=since)
+            self._update_rows(changed)
+            # Переименованная категория меняет поле category у всех её товаров
+            categories = list(Category.objects.filter(updated_at__gte=since).values_list('id', flat=True))
+            if categories:
+                self._update_rows(Product.objects.filter(category_id__in=categories))
+            for product_id in deleted_product_ids(since):
+                self.remove(product_id)
+            self.version = version
+            self.synced_at = synced_at
+
+    def _update_rows(self, queryset):
+        rows = queryset.order_by().values_list(*INDEX_COLUMNS, 'is_available')
+        for product_id, name, description, category_name, stock, is_featured, created_at, is_available in (
+            rows.iterator(chunk_size=2000)
+        ):
+            self.update(product_id, name, description, category_name, stock, is_featured, created_at, is_available)
+
+    @staticmethod
+    def _fields(name, description, category_name):
+        # Порядок ключей совпадает с FIELD_WEIGHTS
+        return {'name': tokenize(name), 'category': tokenize(category_name), 'description': tokenize(description)}
+
+    def _add(self, product_id, fields, stock, is_featured, created_at, averages=None):
+        if averages is None:
+            for field, tokens in fields.items():
+                self.field_lengths[field] += len(tokens)
+            # Средние длины вместе с добавляемым товаром
+            averages = {field: total / (len(self.documents) + 1) for field, total in self.field_lengths.items()}
+        weighted = Counter()
+        for field, tokens in fields.items():
+            if not tokens:
+                continue
+            norm = 1 - BM25_B + BM25_B * len(tokens) / averages[field]
+            for token, frequency in Counter(tokens).items():
+                weighted[token] += FIELD_WEIGHTS[field] * frequency / norm
+        for token, weight in weighted.items():
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = {}
+                if self.version is not None:
+                    insort(self.vocabulary, token)
+            postings[product_id] = weight * (BM25_K1 + 1) / (weight + BM25_K1)
+        first_name_token = fields['name'][0] if fields['name'] else ''
+        lengths = tuple(len(tokens) for tokens in fields.values())
+        self.documents[product_id] = (frozenset(weighted), first_name_token, lengths)
+        self.name_starts.setdefault(first_name_token, set()).add(product_id)
+        self.sort_keys[product_id] = sort_key(stock, is_featured, created_at, product_id)
+
+    def remove(self, product_id):
+        with self._lock:
+            document = self.documents.pop(product_id, None)
+            self.sort_keys.pop(product_id, None)
+            if document is None:
+                return
+            tokens, first_name_token, lengths = document
+            self.name_starts[first_name_token].discard(product_id)
+            if not self.name_starts[first_name_token]:
+                del self.name_starts[first_name_token]
+            for field, length in zip(FIELD_WEIGHTS, lengths):
+                self.field_lengths[field] -= length
+            for token in tokens:
+                postings = self.postings[token]
+                postings.pop(product_id, None)
+                if not postings:
+                    del self.postings[token]
+                    index = bisect_left(self.vocabulary, token)
+                    if index < len(self.vocabulary) and self.vocabulary[index] == token:
+                        del self.vocabulary[index]
+
+    def update(self, product_id, name, description, category_name, stock, is_featured, created_at, is_available):
+        with self._lock:
+            self.remove(product_id)
+            if is_available:
+                self._add(product_id, self._fields(name, description, category_name), stock, is_featured, created_at)
+
+    def _prefix_tokens(self, prefix):
+        vocabulary = self.vocabulary
+        position = bisect_left(vocabulary, prefix)
+        while position < len(vocabulary) and vocabulary[position].startswith(prefix):
+            yield vocabulary[position]
+            position += 1
+
+    def _idf(self, token):
+        frequency = len(self.postings[token])
+        return math.log(1 + (len(self.documents) - frequency + 0.5) / (frequency + 0.5))
+
+    def search(self, query):
+        """id товаров, у которых каждое слово запроса — префикс какого-то токена; сначала самые релевантные"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            matched_tokens = {term: list(self._prefix_tokens(term)) for term in terms}
+            result = None
+            for term in sorted(terms, key=len, reverse=True):
+                matches = set()
+                for token in matched_tokens[term]:
+                    matches.update(self.postings[token])
+                result = matches if result is None else result & matches
+                if not result:
+                    return []
+
+            scores = None
+            for term, tokens in matched_tokens.items():
+                # Для каждого слова запроса берём лучший из подходящих токенов товара
+                best = {}
+                for token in tokens:
+                    postings = self.postings[token]
+                    idf = self._idf(token) * (1.0 if token == term else PARTIAL_MATCH_WEIGHT)
+                    contributions = {pk: idf * postings[pk] for pk in result.intersection(postings)}
+                    if best:
+                        for pk, contribution in contributions.items():
+                            if contribution > best.get(pk, 0.0):
+                                best[pk] = contribution
+                    else:
+                        best = contributions
+                scores = best if scores is None else {pk: score + best[pk] for pk, score in scores.items()}
+            for token in self._prefix_tokens(terms[0]):
+                for pk in result.intersection(self.name_starts.get(token, ())):
+                    scores[pk] *= NAME_PREFIX_BOOST
+
+            # Две устойчивые сортировки (по ключу равенства, затем по релевантности) быстрее ключа-кортежа
+            product_ids = sorted(result, key=self.sort_keys.__getitem__, reverse=True)
+            product_ids.sort(key=scores.__getitem__, reverse=True)
+            return product_ids
+
+
+_index = ProductSearchIndex()
+_build_lock = threading.Lock()
+
+
+def get_product_index():
+    """Индекс товаров этого процесса: строится при первом обращении, затем досинхронизируется"""
+    if _index.version is None:
+        with _build_lock:
+            if _index.version is None:
+                _index.build()
+                return _index
+    _index.refresh()
+    return _index
+
+
+def reset_product_index():
+    """Сбросить индекс (он будет построен заново при следующем поиске)"""
+    with _build_lock:
+        _index.__init__()
+
+
+def index_product(product):
+    """Обновить товар в индексе этого процесса (если индекс уже построен)"""
+    if _index.version is not None:
+        _index.update(product.id, product.name, product.description, product.category.name, product.stock,
+                      product.is_featured, product.created_at, product.is_available)
+
+
+def unindex_product(product_id):
+    if _index.version is not None:
+        _index.remove(product_id)
+
+
+def reindex_category(category_id):
+    """Переиндексировать товары категории (после её переименования)"""
+    if _index.version is not None:
+        with _index._lock:
+            _index._update_rows(Product.objects.filter(category_id=category_id))
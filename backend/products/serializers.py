@@ -1,19 +1,25 @@
 from rest_framework import serializers
 from .models import Category, Product, Cart, CartItem, Favorite, Order, OrderItem
 from users.serializers import UserSerializer
+from .sales import REPORT_GROUPS
 
 
 class CategorySerializer(serializers.ModelSerializer):
     """Сериализатор для списка категорий"""
-    products_count = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
     
     class Meta:
         model = Category
         fields = ['id', 'name', 'description', 'slug', 'image', 'products_count']
     
-    def get_products_count(self, obj):
-        return obj.products.filter(is_available=True).count()
+    def to_representation(self, instance):
+        # В списке товаров одна категория повторяется много раз — сериализуем её один раз на ответ
+        representations = self.context.get('category_representations')
+        if representations is None:
+            return super().to_representation(instance)
+        if instance.pk not in representations:
+            representations[instance.pk] = super().to_representation(instance)
+        return representations[instance.pk]
     
     def get_image(self, obj):
         if obj.image:
@@ -28,16 +34,12 @@ class CategorySerializer(serializers.ModelSerializer):
 
 class CategoryDetailSerializer(serializers.ModelSerializer):
     """Сериализатор для детальной информации о категории"""
-    products_count = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
     
     class Meta:
         model = Category
         fields = ['id', 'name', 'description', 'slug', 'image', 'products_count', 'created_at', 'updated_at']
     
-    def get_products_count(self, obj):
-        return obj.products.filter(is_available=True).count()
-    
     def get_image(self, obj):
         if obj.image:
             request = self.context.get('request')
@@ -47,6 +49,14 @@ class CategoryDetailSerializer(serializers.ModelSerializer):
         return None
 
 
+class CategoryBatchedListSerializer(serializers.ListSerializer):
+    """Список товаров, в котором каждая категория сериализуется один раз на ответ"""
+    
+    def to_representation(self, data):
+        self.context.setdefault('category_representations', {})
+        return super().to_representation(data)
+
+
 class ProductSerializer(serializers.ModelSerializer):
     """Базовый сериализатор для товаров"""
     category = CategorySerializer(read_only=True)
@@ -56,8 +66,13 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'slug', 'category', 'price', 'stock', 'image', 'is_available', 'is_featured', 'created_at', 'updated_at', 'is_favorited']
+        list_serializer_class = CategoryBatchedListSerializer
     
     def get_is_favorited(self, obj):
+        # Если view заранее загрузило избранное пользователя, проверяем по множеству
+        favorite_ids = self.context.get('favorite_ids')
+        if favorite_ids is not None:
+            return obj.id in favorite_ids
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Favorite.objects.filter(user=request.user, product=obj).exists()
@@ -72,22 +87,59 @@ class ProductSerializer(serializers.ModelSerializer):
         return None
 
 
-class ProductListSerializer(serializers.ModelSerializer):
-    """Сериализатор для списка товаров"""
-    category = CategorySerializer(read_only=True)
-    image = serializers.SerializerMethodField()
+class ProductListSerializer(ProductSerializer):
+    """Сериализатор для списков товаров с выбором полей (?fields=id,name,price&expand=category)
+
+    Без параметров выдаёт то же, что ProductSerializer. Если fields задан, category
+    отдаётся как id, а вложенным объектом — только при expand=category.
+    """
+    expandable_fields = ['category']
+    # Колонки модели, нужные каждому полю; is_favorited обходится id
+    field_columns = {
+        'is_favorited': [],
+        'category': ['category_id'],
+    }
     
-    class Meta:
-        model = Product
-        fields = ['id', 'name', 'description', 'slug', 'category', 'price', 'stock', 'image', 'is_available', 'is_featured']
+    class Meta(ProductSerializer.Meta):
+        pass
     
-    def get_image(self, obj):
-        if obj.image:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.image.url)
-            return obj.image.url
-        return None
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None:
+            return
+        for name in set(self.fields) - set(fields):
+            self.fields.pop(name)
+        if 'category' in self.fields and 'category' not in expand:
+            self.fields['category'] = serializers.PrimaryKeyRelatedField(read_only=True)
+    
+    @classmethod
+    def parse_fields(cls, query_params):
+        """Разбирает ?fields= и ?expand=; возвращает (fields, expand), fields=None — все поля"""
+        expand = [name for name in query_params.get('expand', '').split(',') if name]
+        unknown = set(expand) - set(cls.expandable_fields)
+        raw_fields = query_params.get('fields')
+        fields = None
+        if raw_fields:
+            fields = [name for name in raw_fields.split(',') if name]
+            unknown |= set(fields) - set(cls.Meta.fields)
+        if unknown:
+            raise serializers.ValidationError({'fields': f"Неизвестные поля: {', '.join(sorted(unknown))}"})
+        return fields, expand
+    
+    @classmethod
+    def select_columns(cls, queryset, fields, expand):
+        """Ограничивает выборку колонками, которые нужны запрошенным полям"""
+        if fields is None:
+            return queryset
+        columns = {'id'}
+        for name in fields:
+            columns.update(cls.field_columns.get(name, [name]))
+        if 'category' in fields and 'category' in expand:
+            columns.discard('category_id')
+            columns.add('category')
+        else:
+            queryset = queryset.select_related(None)
+        return queryset.only(*columns)
 
 
 class ProductDetailSerializer(serializers.ModelSerializer):
@@ -150,6 +202,38 @@ class UpdateCartItemSerializer(serializers.Serializer):
     quantity = serializers.IntegerField(min_value=1)
 
 
+class CartOperationSerializer(serializers.Serializer):
+    """Одна операция пакетного изменения корзины"""
+    ACTIONS = ('add', 'update', 'remove')
+    
+    action = serializers.ChoiceField(choices=ACTIONS)
+    product_id = serializers.IntegerField(required=False)
+    item_id = serializers.IntegerField(required=False)
+    quantity = serializers.IntegerField(min_value=1, required=False)
+    
+    def validate(self, attrs):
+        action = attrs['action']
+        if action == 'add':
+            if 'product_id' not in attrs:
+                raise serializers.ValidationError({'product_id': 'Обязательное поле для add'})
+            attrs.setdefault('quantity', 1)
+        else:
+            if 'item_id' not in attrs:
+                raise serializers.ValidationError({'item_id': f'Обязательное поле для {action}'})
+            if action == 'update' and 'quantity' not in attrs:
+                raise serializers.ValidationError({'quantity': 'Обязательное поле для update'})
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    """Пакет операций над корзиной; atomic=true — применить всё или ничего"""
+    MAX_OPERATIONS = 100
+    
+    operations = serializers.ListField(child=serializers.DictField(), allow_empty=False,
+                                       max_length=MAX_OPERATIONS)
+    atomic = serializers.BooleanField(default=False)
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     
@@ -158,15 +242,35 @@ class FavoriteSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'created_at']
 
 
+def snapshot_image_url(path, context):
+    """URL картинки по пути из снимка товара (OrderItem.product_image) без обращения к Product"""
+    if not path:
+        return None
+    url = Product._meta.get_field('image').storage.url(path)
+    request = context.get('request')
+    if request:
+        return request.build_absolute_uri(url)
+    return url
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
-    """Сериализатор для элементов заказа"""
-    product = ProductSerializer(read_only=True)
+    """Сериализатор для элементов заказа: товар отдаётся из снимка, сделанного при оформлении"""
+    product = serializers.SerializerMethodField()
     total_price = serializers.SerializerMethodField()
     
     class Meta:
         model = OrderItem
         fields = ['id', 'product', 'quantity', 'price', 'total_price']
     
+    def get_product(self, obj):
+        # id может быть None, если товар удалён из каталога
+        return {
+            'id': obj.product_id,
+            'name': obj.product_name,
+            'slug': obj.product_slug,
+            'image': snapshot_image_url(obj.product_image, self.context),
+        }
+    
     def get_total_price(self, obj):
         return obj.total_price
 
@@ -181,8 +285,45 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['id', 'status', 'status_display', 'total_price', 'shipping_address', 'phone', 'notes', 'items', 'created_at', 'updated_at']
 
 
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """Краткое представление заказа для истории (?view=summary); ждёт Order.objects.with_summary()"""
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    total_items = serializers.IntegerField(source='items_total_quantity', read_only=True)
+    thumbnail = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Order
+        fields = ['id', 'status', 'status_display', 'total_price', 'total_items', 'thumbnail', 'created_at']
+    
+    def get_thumbnail(self, obj):
+        return snapshot_image_url(obj.first_item_image, self.context)
+
+
 class CreateOrderSerializer(serializers.Serializer):
     """Сериализатор для создания заказа"""
     shipping_address = serializers.CharField(required=True)
     phone = serializers.CharField(required=True)
     notes = serializers.CharField(required=False, allow_blank=True)
+
+
+class ExportFilterSerializer(serializers.Serializer):
+    """Фильтры выгрузки; допустимые статусы передаются в context['statuses']"""
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    status = serializers.CharField(required=False)
+    
+    def validate_status(self, value):
+        statuses = self.context['statuses']
+        if value not in statuses:
+            raise serializers.ValidationError(f"Допустимые значения: {', '.join(statuses)}")
+        return value
+    
+    def validate(self, attrs):
+        if attrs.get('date_from') and attrs.get('date_to') and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError({'date_to': 'Конец периода раньше начала'})
+        return attrs
+
+
+class SalesReportSerializer(ExportFilterSerializer):
+    """Параметры отчёта продаж: период, статус заказа и разрез (day / product / category)"""
+    group_by = serializers.ChoiceField(choices=REPORT_GROUPS, default='day')
@@ -0,0 +1,160 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version, bump_favorites_version
+from .models import Category, DeletedProduct, Product, Favorite, Order
+from .sales import fold_deleted, forget_order, move_order
+from .search_index import TOMBSTONE_RETENTION, index_product, reindex_category, unindex_product
+from .suggest import index_product_name, mark_product_removed, rebuild_categories
+from .trigram_index import index_product_trigrams, unindex_product_trigrams
+
+
+def recount_category_products(categories=None):
+    """Пересчитать Category.products_count с нуля (исправляет расхождения); возвращает число исправленных"""
+    available = (
+        Product.objects.filter(category=OuterRef('pk'), is_available=True)
+        .order_by()
+        .values('category')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    actual = Coalesce(Subquery(available), 0)
+    if categories is None:
+        categories = Category.objects.all()
+    updated = categories.exclude(products_count=actual).update(products_count=actual)
+    if updated:
+        # update() мимо сигналов: закэшированные ответы со старыми счётчиками сбрасываем сами
+        transaction.on_commit(bump_catalog_version)
+    return updated
+
+
+def _change_products_count(category_id, delta):
+    categories = Category.objects.filter(pk=category_id)
+    if delta < 0:
+        # Счётчик беззнаковый: не уходим в минус, если он уже разошёлся с данными
+        categories = categories.filter(products_count__gte=-delta)
+    categories.update(products_count=F('products_count') + delta)
+
+
+def _counted_category(category_id, is_available):
+    """Категория, в счётчике которой учтён товар (None, если товар недоступен)"""
+    return category_id if is_available else None
+
+
+@receiver(pre_save, sender=Product)
+def remember_counted_category(sender, instance, raw=False, **kwargs):
+    instance._counted_category_id = None
+    if raw or instance.pk is None:
+        return
+    previous = Product.objects.filter(pk=instance.pk).values('category_id', 'is_available').first()
+    if previous:
+        instance._counted_category_id = _counted_category(previous['category_id'], previous['is_available'])
+
+
+@receiver(post_save, sender=Product)
+def update_products_count_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else getattr(instance, '_counted_category_id', None)
+    new = _counted_category(instance.category_id, instance.is_available)
+    if old != new:
+        if old is not None:
+            _change_products_count(old, -1)
+        if new is not None:
+            _change_products_count(new, 1)
+
+
+@receiver(post_delete, sender=Product)
+def update_products_count_on_delete(sender, instance, **kwargs):
+    if instance.is_available:
+        _change_products_count(instance.category_id, -1)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def invalidate_user_catalog_cache(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(lambda: bump_favorites_version(instance.user_id))
+
+
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(lambda: index_product(instance))
+    transaction.on_commit(lambda: index_product_name(instance))
+    transaction.on_commit(lambda: index_product_trigrams(instance))
+
+
+@receiver(post_delete, sender=Product)
+def remember_deleted_product(sender, instance, **kwargs):
+    # Отметка для индексов поиска других процессов; старые отметки подчищаем здесь же
+    deleted = DeletedProduct.objects.create(product_id=instance.pk)
+    DeletedProduct.objects.filter(deleted_at__lt=deleted.deleted_at - TOMBSTONE_RETENTION).delete()
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    product_id = instance.id
+    transaction.on_commit(lambda: unindex_product(product_id))
+    transaction.on_commit(mark_product_removed)
+    transaction.on_commit(lambda: unindex_product_trigrams(product_id))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def update_category_suggestions(sender, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(rebuild_categories)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    transaction.on_commit(lambda: reindex_category(instance.id))
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_status(sender, instance, raw=False, **kwargs):
+    instance._rollup_status = None
+    if raw or instance.pk is None:
+        return
+    instance._rollup_status = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Order)
+def update_sales_rollup_on_status(sender, instance, created, raw=False, **kwargs):
+    # Новый заказ учитывает checkout после создания позиций; здесь — смена статуса
+    # (update_status, list_editable в админке и любое другое сохранение)
+    if raw or created:
+        return
+    old = getattr(instance, '_rollup_status', None)
+    if old is not None and old != instance.status:
+        move_order(instance, old, instance.status)
+
+
+@receiver(pre_delete, sender=Order)
+def update_sales_rollup_on_delete(sender, instance, **kwargs):
+    forget_order(instance)
+
+
+@receiver(pre_delete, sender=Product)
+@receiver(pre_delete, sender=Category)
+def fold_sales_rollup_on_delete(sender, instance, **kwargs):
+    fold_deleted('product' if sender is Product else 'category', instance.pk)
@@ -0,0 +1,203 @@
+"""
+Автодополнение для строки поиска: названия товаров и категорий по префиксу.
+
+Товары хранятся как отсортированный массив ключей (нормализованное название,
+начиная с каждого слова, обрезанное до MAX_KEY_LENGTH) и параллельный array
+с id товаров. Префикс ищется bisect'ом, берутся первые совпадения по порядку
+ключей, названия и доступность проверяются одним запросом по первичному ключу.
+
+Устаревшие ключи (товар переименован, удалён или скрыт) не удаляются сразу —
+их отсеивает проверка по базе, а когда их становится слишком много, массив
+перестраивается. Категорий мало, их список пересобирается целиком.
+"""
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .sync import get_catalog_state
+from .models import Category, Product
+from .search_index import TOKEN_RE, normalize
+
+MAX_KEY_LENGTH = 40
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 20
+# Доля устаревших ключей, после которой массив перестраивается
+STALE_REBUILD_RATIO = 0.2
+SYNC_OVERLAP = timedelta(minutes=5)
+
+
+def normalize_phrase(text):
+    return ' '.join(normalize(text).split())
+
+
+def phrase_keys(text):
+    """Ключи названия: с начала каждого слова до конца (обрезанные)"""
+    phrase = normalize_phrase(text)
+    return [phrase[match.start():match.start() + MAX_KEY_LENGTH] for match in TOKEN_RE.finditer(phrase)]
+
+
+def matches_prefix(text, prefix):
+    phrase = normalize_phrase(text)
+    return any(phrase.startswith(prefix, match.start()) for match in TOKEN_RE.finditer(phrase))
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.keys = []
+        self.ids = array('q')
+        self.stale = 0
+        self.categories = []
+        self.version = None
+        self.synced_at = None
+
+    def build(self):
+        version = get_catalog_state()
+        synced_at = timezone.now()
+        pairs = []
+        rows = Product.objects.filter(is_available=True).order_by().values_list('id', 'name')
+        for product_id, name in rows.iterator(chunk_size=5000):
+            pairs.extend((key, product_id) for key in phrase_keys(name))
+        pairs.sort()
+        with self._lock:
+            self.keys = [key for key, _product_id in pairs]
+            self.ids = array('q', (product_id for _key, product_id in pairs))
+            self.stale = 0
+            self.build_categories()
+            self.version = version
+            self.synced_at = synced_at
+
+    def build_categories(self):
+        categories = []
+        for category_id, name, slug in Category.objects.filter(is_active=True).values_list('id', 'name', 'slug'):
+            categories.extend((key, category_id, name, slug) for key in phrase_keys(name))
+        categories.sort()
+        self.categories = categories
+
+    def add_product(self, product_id, name):
+        """Добавить ключи товара; прежние ключи (если название изменилось) отсеются при запросе"""
+        with self._lock:
+            for key in phrase_keys(name):
+                start = bisect_left(self.keys, key)
+                end = bisect_right(self.keys, key, lo=start)
+                if product_id in self.ids[start:end]:
+                    continue
+                self.keys.insert(end, key)
+                self.ids.insert(end, product_id)
+            self.stale += 1
+
+    def refresh(self):
+        """Подтянуть изменения из других процессов по смене состояния каталога (products/sync.py)"""
+        version = get_catalog_state()
+        if version == self.version:
+            return
+        if self.stale > len(self.keys) * STALE_REBUILD_RATIO:
+            self.build()
+            return
+        synced_at = timezone.now()
+        changed = (
+            Product.objects.filter(updated_at__gte=self.synced_at - SYNC_OVERLAP, is_available=True)
+            .order_by()
+            .values_list('id', 'name')
+        )
+        with self._lock:
+            for product_id, name in changed:
+                self.add_product(product_id, name)
+            self.build_categories()
+            self.version = version
+            self.synced_at = synced_at
+
+    def _product_candidates(self, prefix, limit):
+        candidates = []
+        seen = set()
+        position = bisect_left(self.keys, prefix[:MAX_KEY_LENGTH])
+        while position < len(self.keys) and len(candidates) < limit and self.keys[position].startswith(prefix[:MAX_KEY_LENGTH]):
+            product_id = self.ids[position]
+            if product_id not in seen:
+                seen.add(product_id)
+                candidates.append(product_id)
+            position += 1
+        return candidates
+
+    def suggest(self, query, limit=DEFAULT_LIMIT):
+        prefix = normalize_phrase(query)
+        if not prefix:
+            return {'categories': [], 'products': []}
+        with self._lock:
+            position = bisect_left(self.categories, (prefix,))
+            categories = []
+            seen = set()
+            while position < len(self.categories) and self.categories[position][0].startswith(prefix):
+                _key, category_id, name, slug = self.categories[position]
+                if category_id not in seen:
+                    seen.add(category_id)
+                    categories.append({'id': category_id, 'name': name, 'slug': slug})
+                position += 1
+            # Запас на устаревшие ключи, которые отсеет проверка по базе
+            candidates = self._product_candidates(prefix, limit * 2)
+
+        rows = Product.objects.filter(id__in=candidates, is_available=True).values('id', 'name', 'slug')
+        by_id = {row['id']: row for row in rows if matches_prefix(row['name'], prefix)}
+        products = [by_id[product_id] for product_id in candidates if product_id in by_id][:limit]
+        return {'categories': categories[:limit], 'products': products}
+
+    def memory_footprint(self):
+        """Оценка занимаемой памяти в байтах (ключи, массив id, категории)"""
+        keys = sys.getsizeof(self.keys) + sum(sys.getsizeof(key) for key in self.keys)
+        ids = sys.getsizeof(self.ids)
+        categories = sys.getsizeof(self.categories) + sum(
+            sys.getsizeof(entry) + sys.getsizeof(entry[0]) + sys.getsizeof(entry[2]) + sys.getsizeof(entry[3])
+            for entry in self.categories
+        )
+        return {'keys': keys, 'ids': ids, 'categories': categories, 'total': keys + ids + categories}
+
+
+_index = SuggestIndex()
+_build_lock = threading.Lock()
+
+
+def get_suggest_index():
+    """Индекс автодополнения этого процесса: строится при старте (warm_up) или при первом запросе"""
+    if _index.version is None:
+        with _build_lock:
+            if _index.version is None:
+                _index.build()
+                return _index
+    _index.refresh()
+    return _index
+
+
+def reset_suggest_index():
+    with _build_lock:
+        _index.__init__()
+
+
+def index_product_name(product):
+    """Добавить название товара в индекс этого процесса (если индекс уже построен)"""
+    if _index.version is not None and product.is_available:
+        _index.add_product(product.id, product.name)
+
+
+def mark_product_removed():
+    if _index.version is not None:
+        _index.stale += 1
+
+
+def rebuild_categories():
+    if _index.version is not None:
+        with _index._lock:
+            _index.build_categories()
+
+
+def warm_up():
+    """Построить индекс при старте сервера (wsgi/asgi), чтобы первый запрос не ждал"""
+    try:
+        get_suggest_index()
+    except DatabaseError:
+        # Таблиц ещё нет (до migrate) — индекс построится при первом запросе
+        reset_suggest_index()
@@ -0,0 +1,62 @@
+"""
+Состояние каталога для данных в памяти процесса: индексов поиска, подсказок и
+кэша результатов поиска.
+
+Изменения каталога увеличивают версию в кэше 'catalog' (products/cache.py), но
+с кэшем в памяти процесса (CATALOG_CACHE_BACKEND=locmem) другие воркеры эту
+версию не видят. Поэтому к версии добавляется отметка из базы: последние
+updated_at товаров и категорий и последняя отметка об удалении товара. Она
+читается одним запросом не чаще раза в CATALOG_SYNC_INTERVAL секунд, так что
+изменения из других процессов доходят до этого не позже чем через интервал при
+любом бэкенде кэша.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .cache import get_catalog_version
+from .models import Category, DeletedProduct, Product
+
+_STAMP_SQL = '''
+    SELECT (SELECT MAX(updated_at) FROM {product}),
+           (SELECT MAX(updated_at) FROM {category}),
+           (SELECT MAX(id) FROM {deleted})
+'''
+
+_lock = threading.Lock()
+_stamp = None
+_checked_at = None
+
+
+def _read_stamp():
+    quote = connection.ops.quote_name
+    sql = _STAMP_SQL.format(
+        product=quote(Product._meta.db_table),
+        category=quote(Category._meta.db_table),
+        deleted=quote(DeletedProduct._meta.db_table),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        return cursor.fetchone()
+
+
+def get_catalog_state():
+    """Версия каталога и отметка из базы; данные в памяти процесса пересинхронизируются при её смене"""
+    global _stamp, _checked_at
+    with _lock:
+        now = time.monotonic()
+        if _checked_at is None or now - _checked_at >= settings.CATALOG_SYNC_INTERVAL:
+            _stamp = _read_stamp()
+            _checked_at = now
+        stamp = _stamp
+    return get_catalog_version(), stamp
+
+
+def reset_catalog_state():
+    """Перечитать отметку из базы сейчас (тесты: интервал отсчитывается заново)"""
+    global _stamp, _checked_at
+    with _lock:
+        _stamp = _read_stamp()
+        _checked_at = time.monotonic()
@@ -1,3 +1,1556 @@
-from django.test import TestCase
+from decimal import Decimal
+import csv
+import json
+import threading
+import tracemalloc
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from users.models import CustomUser
+from .search_index import TOMBSTONE_RETENTION, reset_product_index, sort_key, tokenize, get_product_index
+from .suggest import get_suggest_index, reset_suggest_index
+from .trigram_index import get_trigram_index, reset_trigram_index
+from .sync import reset_catalog_state
+from .search_cache import SearchResultCache, cached_search, get_search_cache
+from .cache import (
+    CART_CACHE_ALIAS, bump_catalog_version, get_cart_cache, get_catalog_cache, get_catalog_version, get_cache_stats,
+    reset_cache_stats,
+)
+from .cart import CartError, add_item, apply_operations, checkout
+from . import sales
+from .sales import order_buckets, rebuild_sales_rollup, record_order, sales_report
+from .models import (
+    Cart, CartItem, Category, DailyOrderTotals, DailySales, DeletedProduct, Product, Favorite, Order, OrderItem,
+)
+from .serializers import CartOperationSerializer, CategorySerializer, ProductSerializer
+
+
+class CatalogTestMixin:
+    """Общие данные для тестов каталога"""
+
+    def create_catalog(self, products_per_category=10, categories=2):
+        # Кэш ответов живёт в памяти процесса и пережил бы предыдущий тест
+        get_catalog_cache().clear()
+        # Файловый кэш корзин переживает и прогон тестов: id пользователей в новой базе повторяются
+        get_cart_cache().clear()
+        reset_product_index()
+        reset_suggest_index()
+        reset_trigram_index()
+        get_search_cache().clear()
+        # Отметка из базы перечитывается сейчас, а не посреди теста с подсчётом запросов
+        reset_catalog_state()
+        self.categories = []
+        self.products = []
+        for c in range(categories):
+            category = Category.objects.create(name=f'Категория {c}', slug=f'category-{c}')
+            self.categories.append(category)
+            for p in range(products_per_category):
+                self.products.append(Product.objects.create(
+                    name=f'Кубик {c}-{p}',
+                    description='Деталь конструктора',
+                    slug=f'cube-{c}-{p}',
+                    category=category,
+                    price=Decimal('10.00') + p,
+                    stock=5,
+                ))
+
+    def create_user(self, email='user@example.com'):
+        return CustomUser.objects.create_user(email=email, password='secret123', username=email)
+
+
+class FavoritesContextTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog()
+        self.user = self.create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Favorite.objects.create(user=self.user, product=self.products[0])
+        Favorite.objects.create(user=self.user, product=self.products[3])
+
+    def test_is_favorited_uses_prefetched_ids(self):
+        response = self.client.get('/api/products/', {'page_size': 20})
+        self.assertEqual(response.status_code, 200)
+        favorited = {item['id'] for item in response.data['results'] if item['is_favorited']}
+        self.assertEqual(favorited, {self.products[0].id, self.products[3].id})
+
+    def test_favorites_query_does_not_grow_with_page_size(self):
+        for page_size in (2, 20):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get('/api/products/', {'page_size': page_size})
+            favorite_queries = [q for q in ctx.captured_queries if 'products_favorite' in q['sql']]
+            self.assertEqual(len(favorite_queries), 1)
+
+    def test_anonymous_user_skips_favorites_query(self):
+        client = APIClient()
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get('/api/products/')
+        self.assertFalse(any(item['is_favorited'] for item in response.data['results']))
+        self.assertFalse([q for q in ctx.captured_queries if 'products_favorite' in q['sql']])
+
+
+class CatalogQueryBudgetTests(CatalogTestMixin, TestCase):
+    """Число запросов к каталогу не должно зависеть от размера страницы"""
+
+    def setUp(self):
+        self.create_catalog(products_per_category=30)
+        self.client = APIClient()
+
+    def assertQueryBudget(self, url, budget, params=None):
+        for page_size in (5, 50):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, {**(params or {}), 'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(
+                len(ctx.captured_queries), budget,
+                f'{url} page_size={page_size}: {len(ctx.captured_queries)} запросов',
+            )
+
+    def test_product_list_budget(self):
+        # COUNT пагинатора и страница товаров вместе с категориями
+        self.assertQueryBudget('/api/products/', 2)
+
+    def test_category_products_budget(self):
+        self.assertQueryBudget(f'/api/categories/{self.categories[0].id}/products/', 3)
+
+    def test_search_budget(self):
+        self.assertQueryBudget('/api/products/search/', 5, {'q': 'кубик'})
+
+    def test_category_list_is_single_query(self):
+        for c in range(2, 12):
+            Category.objects.create(name=f'Категория {c}', slug=f'category-{c}')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/categories/')
+        counts = {item['id']: item['products_count'] for item in response.data}
+        self.assertEqual(counts[self.categories[0].id], 30)
+
+
+class CategoryProductsCountTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=3)
+        self.first, self.second = self.categories
+
+    def assertCounts(self, first, second):
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.products_count, self.second.products_count), (first, second))
+
+    def test_create_and_delete(self):
+        self.assertCounts(3, 3)
+        Product.objects.create(name='Ось', description='', slug='axle', category=self.first, price=1)
+        Product.objects.create(name='Скрытый', description='', slug='hidden', category=self.first, price=1,
+                               is_available=False)
+        self.assertCounts(4, 3)
+        self.products[0].delete()
+        self.assertCounts(3, 3)
+
+    def test_change_category_and_availability(self):
+        product = self.products[0]
+        product.category = self.second
+        product.save()
+        self.assertCounts(2, 4)
+        product.is_available = False
+        product.save()
+        self.assertCounts(2, 3)
+        product.category = self.first
+        product.is_available = True
+        product.save()
+        self.assertCounts(3, 3)
+
+    def test_admin_list_editable(self):
+        admin = CustomUser.objects.create_superuser(email='admin@example.com', password='secret123',
+                                                    username='admin')
+        self.client.force_login(admin)
+        products = Product.objects.filter(category=self.first).order_by('-created_at')
+        data = {
+            'form-TOTAL_FORMS': str(len(products)),
+            'form-INITIAL_FORMS': str(len(products)),
+            '_save': 'Сохранить',
+        }
+        for i, product in enumerate(products):
+            data.update({
+                f'form-{i}-id': str(product.pk),
+                f'form-{i}-price': str(product.price),
+                f'form-{i}-stock': str(product.stock),
+            })
+            # is_available не передаём — чекбоксы сняты у всех товаров категории
+        response = self.client.post(f'/admin/products/product/?category__id__exact={self.first.pk}', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertCounts(0, 3)
+
+    def test_recount_command_fixes_drift(self):
+        Category.objects.update(products_count=42)
+        self.client.get('/api/categories/')
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('recount_category_products', stdout=StringIO())
+        self.assertCounts(3, 3)
+        response = self.client.get('/api/categories/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual([item['products_count'] for item in response.data], [3, 3])
+        # Счётчики уже верные — версию каталога не трогаем
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('recount_category_products', stdout=StringIO())
+        self.assertEqual(get_catalog_version(), version)
+
+
+class CatalogResponseCacheTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=3)
+        self.client = APIClient()
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get('/api/products/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/products/')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+
+    def test_query_parameters_are_part_of_the_key(self):
+        self.client.get('/api/products/', {'page_size': 2, 'page': 1})
+        response = self.client.get('/api/products/', {'page': 1, 'page_size': 2})
+        self.assertEqual(response['X-Cache'], 'HIT')
+        response = self.client.get('/api/products/', {'page_size': 3})
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_product_change_invalidates(self):
+        self.client.get(f'/api/products/{self.products[0].id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.products[0].pk).first().save()
+        response = self.client.get(f'/api/products/{self.products[0].id}/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_category_change_invalidates(self):
+        self.client.get('/api/categories/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categories[0].name = 'Новое имя'
+            self.categories[0].save()
+        response = self.client.get('/api/categories/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Новое имя', [item['name'] for item in response.data])
+
+    def test_users_do_not_share_cached_favorites(self):
+        user = self.create_user()
+        other = self.create_user('other@example.com')
+        Favorite.objects.create(user=user, product=self.products[0])
+        url = f'/api/products/{self.products[0].id}/'
+        self.client.force_authenticate(user)
+        self.assertTrue(self.client.get(url).data['is_favorited'])
+        self.client.force_authenticate(other)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertFalse(response.data['is_favorited'])
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+
+    def test_favorite_toggle_invalidates_only_that_user(self):
+        user = self.create_user()
+        self.client.force_authenticate(user)
+        url = f'/api/products/{self.products[0].id}/'
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/favorites/toggle/', {'product_id': self.products[0].id})
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertTrue(response.data['is_favorited'])
+
+    def test_stats(self):
+        reset_cache_stats()
+        self.client.get('/api/categories/')
+        self.client.get('/api/categories/')
+        self.client.get('/api/categories/')
+        stats = get_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        out = StringIO()
+        call_command('catalog_cache_stats', stdout=out)
+        self.assertIn('66.7%', out.getvalue())
+
+
+class CursorPaginationTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=7)
+        self.client = APIClient()
+
+    def walk(self, url, params):
+        seen = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertNotIn('count', response.data)
+            seen.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                return seen
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_walk_returns_every_product_once(self):
+        seen = self.walk('/api/products/', {'pagination': 'cursor', 'page_size': 4})
+        self.assertEqual(sorted(seen), sorted(p.id for p in self.products))
+
+    def test_category_products_cursor(self):
+        category = self.categories[0]
+        seen = self.walk(f'/api/categories/{category.id}/products/', {'pagination': 'cursor', 'page_size': 3})
+        self.assertEqual(sorted(seen), sorted(p.id for p in self.products if p.category_id == category.id))
+
+    def test_cursor_page_skips_count_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/products/', {'pagination': 'cursor'})
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql'].upper()])
+
+    def test_page_number_is_default(self):
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.data['count'], len(self.products))
+
+
+class SparseFieldsTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=5)
+        self.client = APIClient()
+
+    def test_default_output_is_unchanged(self):
+        response = self.client.get('/api/products/')
+        self.assertEqual(list(response.data['results'][0]), ProductSerializer.Meta.fields)
+        self.assertIsInstance(response.data['results'][0]['category'], dict)
+
+    def test_fields_limits_output_and_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/products/', {'fields': 'id,name,price,image,stock'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'price', 'image', 'stock'})
+        page_query = ctx.captured_queries[-1]['sql']
+        self.assertNotIn('description', page_query)
+        self.assertNotIn('products_category', page_query)
+
+    def test_category_is_id_unless_expanded(self):
+        response = self.client.get('/api/products/', {'fields': 'id,category'})
+        self.assertIsInstance(response.data['results'][0]['category'], int)
+        response = self.client.get('/api/products/', {'fields': 'id,category', 'expand': 'category'})
+        self.assertEqual(response.data['results'][0]['category']['products_count'], 5)
+
+    def test_fields_on_search_retrieve_and_category_products(self):
+        urls = [
+            ('/api/products/search/', {'q': 'кубик'}),
+            (f'/api/products/{self.products[0].id}/', {}),
+            (f'/api/categories/{self.categories[0].id}/products/', {}),
+        ]
+        for url, params in urls:
+            response = self.client.get(url, {**params, 'fields': 'id,name'})
+            data = response.data.get('results', response.data)
+            item = data[0] if isinstance(data, list) else data
+            self.assertEqual(set(item), {'id', 'name'}, url)
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/products/', {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FastSerializerTests(CatalogTestMixin, TestCase):
+    """Быстрый путь обязан давать ровно тот же JSON, что и ModelSerializer"""
+
+    def setUp(self):
+        self.create_catalog(products_per_category=4)
+        Product.objects.filter(pk=self.products[0].pk).update(image='products/кубик.jpg', price=Decimal('7.5'))
+        Category.objects.filter(pk=self.categories[1].pk).update(image='categories/ось.jpg')
+        self.user = self.create_user()
+        Favorite.objects.create(user=self.user, product=self.products[1])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def render_expected(self, products, serializer_class, response):
+        context = {'request': response.wsgi_request, 'favorite_ids': {self.products[1].id}}
+        return JSONRenderer().render(serializer_class(products, many=True, context=context).data)
+
+    def test_product_list_matches_product_serializer(self):
+        response = self.client.get('/api/products/', {'page_size': 100})
+        products = Product.objects.filter(is_available=True).select_related('category')
+        expected = self.render_expected(products, ProductSerializer, response)
+        self.assertEqual(JSONRenderer().render(response.data['results']), expected)
+
+    def test_category_products_match_product_serializer(self):
+        category = self.categories[1]
+        response = self.client.get(f'/api/categories/{category.id}/products/', {'page_size': 100})
+        products = Product.objects.filter(category=category, is_available=True).select_related('category')
+        expected = self.render_expected(products, ProductSerializer, response)
+        self.assertEqual(JSONRenderer().render(response.data['results']), expected)
+
+    def test_category_list_matches_category_serializer(self):
+        response = self.client.get('/api/categories/')
+        expected = self.render_expected(Category.objects.all(), CategorySerializer, response)
+        self.assertEqual(JSONRenderer().render(response.data), expected)
+
+
+class QueryPlanTests(TestCase):
+    def test_endpoint_queries_use_indexes(self):
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertNotIn('FULL SCAN', out.getvalue())
+
+
+class ProductFilterTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        # В каждой категории цены 10..14, в наличии у всех по 5 штук
+        self.create_catalog(products_per_category=5)
+        self.first, self.second = self.categories
+        Product.objects.filter(pk=self.products[0].pk).update(stock=0, is_featured=True)
+        Product.objects.filter(pk=self.products[5].pk).update(price=Decimal('700.00'))
+        self.client = APIClient()
+
+    def ids(self, params):
+        response = self.client.get('/api/products/', {**params, 'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        return {item['id'] for item in response.data['results']}
+
+    def test_filter_by_category_slug_or_id(self):
+        expected = {p.id for p in self.products if p.category_id == self.first.id}
+        self.assertEqual(self.ids({'category': self.first.slug}), expected)
+        self.assertEqual(self.ids({'category': str(self.first.id)}), expected)
+        # Не id (не ASCII-цифры или больше bigint) — ищется как slug
+        for value in ('²', '9' * 23):
+            self.assertEqual(self.ids({'category': value}), set())
+
+    def test_filter_by_price_stock_and_featured(self):
+        self.assertEqual(self.ids({'min_price': 500}), {self.products[5].id})
+        self.assertEqual(len(self.ids({'max_price': '11.00'})), 3)
+        self.assertEqual(self.ids({'in_stock': 'false'}), {self.products[0].id})
+        self.assertEqual(self.ids({'featured': 'true'}), {self.products[0].id})
+
+    def test_facets_follow_other_filters(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/products/', {'facets': 'true', 'category': self.first.slug,
+                                                          'in_stock': 'true'})
+        facets = response.data['facets']
+        # Фасет категорий не сужается собственным фильтром, но учитывает in_stock
+        self.assertEqual({row['slug']: row['count'] for row in facets['categories']},
+                         {self.first.slug: 4, self.second.slug: 5})
+        price = {row['min']: row['count'] for row in facets['price']}
+        self.assertEqual(price[0], 4)
+        self.assertEqual(price[500], 0)
+        # COUNT, страница и по одному запросу на каждый фасет
+        self.assertEqual(len(ctx.captured_queries), 4)
+
+    def test_price_facet_ignores_price_filter(self):
+        response = self.client.get('/api/products/', {'facets': '1', 'min_price': 500})
+        self.assertEqual(response.data['count'], 1)
+        price = {row['min']: row['count'] for row in response.data['facets']['price']}
+        self.assertEqual((price[0], price[500]), (9, 1))
+
+
+class ProductBatchTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=5)
+        Product.objects.filter(pk=self.products[2].pk).update(is_available=False)
+        self.user = self.create_user()
+        Favorite.objects.create(user=self.user, product=self.products[1])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_results_in_request_order_with_missing_entries(self):
+        ids = [self.products[4].id, 999999, self.products[1].id, self.products[2].id]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/products/batch/', {'ids': ','.join(map(str, ids))})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual(list(results), [str(pk) for pk in ids])
+        self.assertEqual(results[str(self.products[4].id)]['name'], self.products[4].name)
+        self.assertTrue(results[str(self.products[1].id)]['is_favorited'])
+        self.assertEqual(response.data['not_found'], ['999999', str(self.products[2].id)])
+        # Товары с категориями и избранное пользователя
+        self.assertEqual(len(ctx.captured_queries), 2)
+
+    def test_slugs_and_sparse_fields(self):
+        response = self.client.get('/api/products/batch/', {
+            'slugs': f'{self.products[3].slug},missing', 'ids': str(self.products[0].id), 'fields': 'id,price',
+        })
+        results = response.data['results']
+        self.assertEqual(list(results), [str(self.products[0].id), self.products[3].slug, 'missing'])
+        self.assertEqual(set(results[self.products[3].slug]), {'id', 'price'})
+        self.assertIsNone(results['missing'])
+
+    def test_limits_and_validation(self):
+        self.assertEqual(self.client.get('/api/products/batch/').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/batch/', {'ids': '1,x'}).status_code, 400)
+        for value in ('0', str(2 ** 63), '9' * 40, '²'):
+            self.assertEqual(self.client.get('/api/products/batch/', {'ids': f'1,{value}'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/products/batch/', {'ids': str(2 ** 63 - 1)}).status_code, 200)
+        too_many = ','.join(str(i) for i in range(1, 302))
+        self.assertEqual(self.client.get('/api/products/batch/', {'ids': too_many}).status_code, 400)
+
+
+class SearchIndexTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=2)
+        self.client = APIClient()
+        self.lego = Product.objects.create(name='Набор LEGO Технік', description='Жёлтый кирпич 2x4',
+                                           slug='lego-set', category=self.categories[0], price=5, stock=1)
+
+    def search_ids(self, query):
+        response = self.client.get('/api/products/search/', {'q': query, 'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_tokenize_folds_case_for_cyrillic_and_latin(self):
+        self.assertEqual(tokenize('КУБИК Ёлка LeGo-2x4'), ['кубик', 'елка', 'lego', '2x4'])
+
+    def test_and_prefix_query_over_name_and_description(self):
+        self.assertEqual(self.search_ids('lego жёлт'), [self.lego.id])
+        self.assertEqual(self.search_ids('ЛЕГО'), [])
+        self.assertEqual(self.search_ids('ЖЕЛТЫЙ КИРП'), [self.lego.id])
+        self.assertEqual(self.search_ids('lego кубик'), [])
+
+    def test_results_newest_first(self):
+        ids = self.search_ids('кубик')
+        expected = list(Product.objects.filter(name__startswith='Кубик').order_by('-created_at', 'id')
+                        .values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_signals_update_built_index(self):
+        self.assertEqual(self.search_ids('шестерня'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            gear = Product.objects.create(name='Шестерня', description='', slug='gear',
+                                          category=self.categories[1], price=1)
+        self.assertEqual(get_product_index().search('шест'), [gear.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            gear.is_available = False
+            gear.save()
+        self.assertEqual(get_product_index().search('шест'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lego.delete()
+        self.assertEqual(get_product_index().search('lego'), [])
+
+    def test_refresh_picks_up_changes_from_other_processes(self):
+        get_product_index()
+        # Изменение, о котором этот процесс не получил сигнал
+        Product.objects.filter(pk=self.lego.pk).update(name='Балка', updated_at=timezone.now())
+        bump_catalog_version()
+        self.assertEqual(get_product_index().search('балка'), [self.lego.id])
+        self.assertEqual(get_product_index().search('набор'), [])
+
+    def test_refresh_drops_products_deleted_by_other_processes(self):
+        self.assertEqual(len(self.search_ids('кубик')), 4)
+        self.assertEqual(len(get_trigram_index().search('кубек')), 4)
+        # Удаление в другом процессе: on_commit-обработчики этого процесса не сработали, пришла только новая версия
+        deleted = [product.pk for product in self.products[:2]]
+        Product.objects.filter(pk__in=deleted).delete()
+        bump_catalog_version()
+        response = self.client.get('/api/products/search/', {'q': 'кубик', 'page_size': 2})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([item['id'] for item in response.data['results']],
+                         [product.pk for product in reversed(self.products[2:])])
+        self.assertEqual(len(get_trigram_index().search('кубек')), 2)
+        # Удаления берутся из отметок, а не сверкой со всеми id каталога: запросы не зависят от его размера
+        bump_catalog_version()
+        # (товары, категории, товары изменённых категорий, отметки об удалении)
+        with self.assertNumQueries(4):
+            get_product_index()
+
+    @override_settings(CATALOG_SYNC_INTERVAL=0)
+    def test_changes_from_other_workers_arrive_without_shared_version(self):
+        def search(query):
+            return cached_search(query, lambda normalized: (get_product_index().search(normalized), False))[0]
+
+        self.assertEqual(search('набор'), [self.lego.id])
+        self.assertEqual(len(get_trigram_index().search('кубек')), 4)
+        self.assertEqual(len(get_suggest_index().suggest('кубик')['products']), 4)
+        # Другой воркер со своим locmem-кэшем: версия каталога в этом процессе не меняется
+        version = get_catalog_version()
+        Product.objects.filter(pk=self.lego.pk).update(name='Балка', updated_at=timezone.now())
+        self.products[0].delete()
+        self.assertEqual(get_catalog_version(), version)
+        self.assertEqual(search('набор'), [])
+        self.assertEqual(search('балка'), [self.lego.id])
+        self.assertEqual(len(get_trigram_index().search('кубек')), 3)
+        self.assertEqual(get_suggest_index().suggest('бал')['products'][0]['id'], self.lego.id)
+
+    def test_old_tombstones_are_pruned(self):
+        DeletedProduct.objects.create(product_id=999)
+        DeletedProduct.objects.update(deleted_at=timezone.now() - TOMBSTONE_RETENTION * 2)
+        lego_id = self.lego.pk
+        self.lego.delete()
+        self.assertEqual(list(DeletedProduct.objects.values_list('product_id', flat=True)), [lego_id])
+
+    def test_sort_key_orders_large_ids(self):
+        created_at = timezone.now()
+        keys = [sort_key(1, False, created_at, product_id) for product_id in (2 ** 32 - 1, 2 ** 32, 2 ** 63 - 1)]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+        self.assertGreater(keys[-1], sort_key(0, True, created_at, 1))
+
+
+@override_settings(PRODUCT_SEARCH_BACKEND='fts')
+class FtsSearchTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=2)
+        self.client = APIClient()
+        self.in_name = Product.objects.create(name='Жёлтая шестерня', description='Деталь', slug='gear',
+                                              category=self.categories[0], price=1)
+        self.in_description = Product.objects.create(name='Ось', description='для шестерни', slug='axle',
+                                                     category=self.categories[0], price=1)
+
+    def search_ids(self, query):
+        response = self.client.get('/api/products/search/', {'q': query, 'page_size': 100})
+        return [item['id'] for item in response.data['results']]
+
+    def test_name_match_ranks_above_description_match(self):
+        self.assertEqual(self.search_ids('ШЕСТЕРН'), [self.in_name.id, self.in_description.id])
+
+    def test_yo_and_case_folding(self):
+        self.assertEqual(self.search_ids('желтая'), [self.in_name.id])
+        self.assertEqual(self.search_ids('ЖЁЛТ шест'), [self.in_name.id])
+
+    def test_triggers_keep_table_in_sync(self):
+        self.in_name.name = 'Колесо'
+        self.in_name.save()
+        self.assertEqual(self.search_ids('колесо'), [self.in_name.id])
+        self.assertEqual(self.search_ids('шестерн'), [self.in_description.id])
+        self.in_description.delete()
+        # Другой запрос: ответ на прежний закэширован до коммита, а в TestCase коммита нет
+        self.assertEqual(self.search_ids('шест'), [])
+
+    def test_unavailable_products_are_excluded(self):
+        Product.objects.filter(pk=self.in_name.pk).update(is_available=False)
+        self.assertEqual(self.search_ids('шестерн'), [self.in_description.id])
+
+    def test_orm_backend_is_still_available(self):
+        with override_settings(PRODUCT_SEARCH_BACKEND='orm'):
+            self.assertEqual(self.search_ids('Ось'), [self.in_description.id])
+
+
+class SearchRankingTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=2)
+        self.client = APIClient()
+        gears = Category.objects.create(name='Шестерня', slug='gears')
+        self.in_description = self.add('Деталь', 'шестерня', 'in-description')
+        self.in_category = self.add('Деталь', 'крепёж', 'in-category', category=gears)
+        self.in_name = self.add('Шестерня', 'крепёж', 'in-name')
+        self.continuation = self.add('Шестерняшка', 'игрушка', 'continuation')
+
+    def add(self, name, description, slug, category=None, **kwargs):
+        return Product.objects.create(name=name, description=description, slug=slug,
+                                      category=category or self.categories[0], price=1, **kwargs)
+
+    def search_ids(self, query):
+        response = self.client.get('/api/products/search/', {'q': query, 'page_size': 100})
+        return [item['id'] for item in response.data['results']]
+
+    def test_field_weights_and_exact_match_above_prefix(self):
+        self.assertEqual(self.search_ids('шестерня'), [
+            self.in_name.id, self.continuation.id, self.in_category.id, self.in_description.id,
+        ])
+        self.assertEqual(self.search_ids('шестерняш'), [self.continuation.id])
+
+    def test_ties_broken_by_stock_then_featured(self):
+        low = self.add('Колесо', 'колесо', 'wheel-low', stock=1)
+        featured = self.add('Колесо', 'колесо', 'wheel-featured', stock=1, is_featured=True)
+        high = self.add('Колесо', 'колесо', 'wheel-high', stock=9)
+        self.assertEqual(self.search_ids('колесо'), [high.id, featured.id, low.id])
+
+    def test_category_rename_reindexes_its_products(self):
+        get_product_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.get(slug='gears')
+            category.name = 'Оси'
+            category.save()
+        self.assertEqual(get_product_index().search('оси'), [self.in_category.id])
+
+
+class TypoFallbackTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=2)
+        self.client = APIClient()
+        self.lego = Product.objects.create(name='Набор LEGO Технік', description='', slug='lego-set',
+                                           category=self.categories[0], price=5, stock=1)
+
+    def search(self, query):
+        response = self.client.get('/api/products/search/', {'q': query, 'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_exact_hits_skip_fallback(self):
+        data = self.search('кубик')
+        self.assertFalse(data['fuzzy'])
+        self.assertEqual(data['count'], 4)
+
+    def test_typos_fall_back_to_similar_words(self):
+        for query in ('кубек', 'КУБИКК', 'убик'):
+            data = self.search(query)
+            self.assertTrue(data['fuzzy'], query)
+            self.assertEqual(data['count'], 4, query)
+        self.assertEqual([item['id'] for item in self.search('lgo набр')['results']], [self.lego.id])
+        self.assertEqual(self.search('шестерня')['count'], 0)
+
+    def test_candidates_come_from_trigram_postings(self):
+        index = get_trigram_index()
+        self.assertEqual(set(index.similar_words('кубек')), {'кубик'})
+        self.assertEqual(index.similar_words('колесо'), {})
+
+    def test_signals_update_trigram_index(self):
+        get_trigram_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lego.name = 'Шестерня'
+            self.lego.save()
+        self.assertEqual(get_trigram_index().search('шестерна'), [self.lego.id])
+        self.assertEqual(get_trigram_index().search('lgo'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lego.delete()
+        self.assertEqual(get_trigram_index().search('шестерна'), [])
+        self.assertNotIn('шестерня', get_trigram_index().vocabulary)
+
+
+class SearchResultCacheTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=5)
+        self.client = APIClient()
+
+    def search(self, query, **params):
+        response = self.client.get('/api/products/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_normalized_queries_and_pages_share_one_entry(self):
+        first = self.search('Кубик')
+        self.assertEqual(first['count'], 10)
+        self.assertEqual(self.search('  КУБИК ')['results'], first['results'])
+        self.assertEqual(len(self.search('кубик', page=2)['results']), 1)
+        stats = get_search_cache().stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (2, 1, 1))
+
+    def test_whitespace_only_query_returns_empty_page(self):
+        for backend in ('index', 'fts', 'orm'):
+            with self.subTest(backend=backend), override_settings(PRODUCT_SEARCH_BACKEND=backend):
+                data = self.search('  \t ')
+                self.assertEqual((data['count'], data['results'], data['fuzzy']), (0, [], False))
+        self.assertEqual(get_search_cache().stats()['entries'], 0)
+
+    def test_catalog_change_invalidates_results(self):
+        self.search('кубик')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Кубик новый', slug='cube-new', category=self.categories[0], price=1)
+        self.assertEqual(self.search('кубик ')['count'], 11)
+
+    def test_lru_eviction_and_ttl(self):
+        cache = SearchResultCache(max_entries=2, timeout=60)
+        cache.set('a', [1])
+        cache.set('b', [2])
+        cache.get('a')
+        cache.set('c', [3])
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), [1])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+        expired = SearchResultCache(max_entries=2, timeout=-1)
+        expired.set('a', [1])
+        self.assertIsNone(expired.get('a'))
+        self.assertEqual(expired.stats()['expirations'], 1)
+
+    def test_stats_exposed_for_admins(self):
+        self.search('кубик')
+        admin = CustomUser.objects.create_superuser(email='admin@example.com', password='secret123',
+                                                    username='admin')
+        self.client.force_authenticate(admin)
+        response = self.client.get('/api/catalog-cache/stats/')
+        self.assertEqual(response.data['search']['misses'], 1)
+        self.assertIn('evictions', response.data['search'])
+
+
+class SuggestTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=2)
+        self.client = APIClient()
+        self.lego = Product.objects.create(name='Набор LEGO Технік', description='', slug='lego-set',
+                                           category=self.categories[0], price=5, stock=1)
+
+    def suggest(self, query, **params):
+        response = self.client.get('/api/products/suggest/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_prefix_of_any_word_in_name(self):
+        for query in ('наб', 'LEGO', 'lego тех', 'ТЕХН'):
+            self.assertEqual([p['slug'] for p in self.suggest(query)['products']], ['lego-set'], query)
+        self.assertEqual(self.suggest('техника')['products'], [])
+
+    def test_categories_and_limit(self):
+        data = self.suggest('кат')
+        self.assertEqual([c['slug'] for c in data['categories']], ['category-0', 'category-1'])
+        self.assertEqual(len(self.suggest('кубик', limit=3)['products']), 3)
+        self.assertEqual(self.client.get('/api/products/suggest/', {'q': 'к', 'limit': 'x'}).status_code, 400)
+
+    def test_signals_keep_suggestions_current(self):
+        get_suggest_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lego.name = 'Шестерня'
+            self.lego.save()
+            Category.objects.create(name='Детали', slug='parts')
+        self.assertEqual([p['id'] for p in get_suggest_index().suggest('шест')['products']], [self.lego.id])
+        self.assertEqual(get_suggest_index().suggest('lego')['products'], [])
+        self.assertEqual([c['slug'] for c in get_suggest_index().suggest('дет')['categories']], ['parts'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lego.delete()
+        self.assertEqual(get_suggest_index().suggest('шест')['products'], [])
+
+    def test_stats_command_reports_memory(self):
+        out = StringIO()
+        call_command('suggest_stats', queries=10, stdout=out)
+        self.assertIn('total', out.getvalue())
+        self.assertIn('p99', out.getvalue())
+
+
+class CartMutationTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=2, categories=1)
+        self.product = self.products[0]
+        self.user = self.create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add(self, product_id, quantity):
+        return self.client.post('/api/cart/add_item/', {'product_id': product_id, 'quantity': quantity})
+
+    def test_add_accumulates_and_checks_total_against_stock(self):
+        self.assertEqual(self.add(self.product.id, 2).status_code, 201)
+        response = self.add(self.product.id, 3)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['items'][0]['quantity'], 5)
+        response = self.add(self.product.id, 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Недостаточно товара на складе')
+        self.assertEqual(CartItem.objects.get().quantity, 5)
+
+    def test_add_unavailable_product(self):
+        Product.objects.filter(pk=self.product.pk).update(is_available=False)
+        self.assertEqual(self.add(self.product.id, 1).status_code, 404)
+        self.assertEqual(self.add(999999, 1).status_code, 404)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_update_and_remove_only_own_items(self):
+        self.add(self.product.id, 1)
+        item = CartItem.objects.get()
+        self.assertEqual(self.client.put('/api/cart/update_item/', {'item_id': item.id, 'quantity': 4}).data
+                         ['items'][0]['quantity'], 4)
+        self.assertEqual(self.client.put('/api/cart/update_item/', {'item_id': item.id, 'quantity': 6})
+                         .status_code, 400)
+
+        other = APIClient()
+        other.force_authenticate(self.create_user('other@example.com'))
+        self.assertEqual(other.put('/api/cart/update_item/', {'item_id': item.id, 'quantity': 1}).status_code, 404)
+        self.assertEqual(other.delete('/api/cart/remove_item/', {'item_id': item.id}).status_code, 404)
+
+        response = self.client.delete('/api/cart/remove_item/', {'item_id': item.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'], [])
+
+    def test_add_runs_single_mutation_statement(self):
+        cart = Cart.objects.create(user=self.user)
+        add_item(cart, self.product.id, 1)
+        with CaptureQueriesContext(connection) as ctx:
+            add_item(cart, self.product.id, 1)
+        statements = [q['sql'] for q in ctx.captured_queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        # upsert с проверкой остатка + обновление updated_at корзины
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+
+class CartBatchTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=3, categories=1)
+        self.user = self.create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.client.post('/api/cart/add_item/', {'product_id': self.products[0].id, 'quantity': 1})
+        self.item = CartItem.objects.get()
+
+    def batch(self, operations, **kwargs):
+        return self.client.post('/api/cart/batch/', {'operations': operations, **kwargs}, format='json')
+
+    def quantities(self):
+        return dict(CartItem.objects.values_list('product_id', 'quantity'))
+
+    def test_operations_applied_in_order_with_per_operation_errors(self):
+        first, second, third = self.products
+        response = self.batch([
+            {'action': 'add', 'product_id': second.id, 'quantity': 2},
+            {'action': 'add', 'product_id': second.id, 'quantity': 1},
+            {'action': 'update', 'item_id': self.item.id, 'quantity': 4},
+            {'action': 'add', 'product_id': third.id, 'quantity': 50},
+            {'action': 'add', 'product_id': 999999},
+            {'action': 'remove'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.data['results']],
+                         ['ok', 'ok', 'ok', 'error', 'error', 'error'])
+        self.assertEqual(response.data['results'][3]['error'], 'Недостаточно товара на складе')
+        self.assertEqual(response.data['results'][4]['status_code'], 404)
+        self.assertEqual(self.quantities(), {first.id: 4, second.id: 3})
+        self.assertEqual(response.data['cart']['total_items'], 7)
+
+    def test_remove_then_add_again(self):
+        response = self.batch([
+            {'action': 'remove', 'item_id': self.item.id},
+            {'action': 'update', 'item_id': self.item.id, 'quantity': 2},
+            {'action': 'add', 'product_id': self.products[0].id, 'quantity': 2},
+        ])
+        self.assertEqual([result['status'] for result in response.data['results']], ['ok', 'error', 'ok'])
+        self.assertEqual(self.quantities(), {self.products[0].id: 2})
+
+    def test_atomic_batch_is_all_or_nothing(self):
+        response = self.batch([
+            {'action': 'add', 'product_id': self.products[1].id},
+            {'action': 'update', 'item_id': self.item.id, 'quantity': 100},
+        ], atomic=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {self.products[0].id: 1})
+        self.assertEqual(len(response.data['cart']['items']), 1)
+
+    def test_writes_are_bulk(self):
+        operations = [{'action': 'add', 'product_id': product.id} for product in self.products[1:]]
+        operations.append({'action': 'update', 'item_id': self.item.id, 'quantity': 2})
+        validated = []
+        for operation in operations:
+            serializer = CartOperationSerializer(data=operation)
+            serializer.is_valid(raise_exception=True)
+            validated.append(serializer.validated_data)
+        cart = Cart.objects.get(user=self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            apply_operations(cart, validated)
+        statements = [q['sql'] for q in ctx.captured_queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        # updated_at, позиции, товары, bulk_create, bulk_update
+        self.assertEqual(len(statements), 5)
+
+    def test_invalid_envelope(self):
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(self.client.post('/api/cart/batch/', {}, format='json').status_code, 400)
+
+
+class CartTotalsTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=25, categories=2)
+        self.user = self.create_user()
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.bulk_create(
+            CartItem(cart=self.cart, product=product, quantity=2) for product in self.products
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_totals_computed_by_database(self):
+        expected = sum(product.price * 2 for product in self.products)
+        self.assertEqual(Cart.objects.with_totals().get(pk=self.cart.pk).total_price, expected)
+        cart = Cart.objects.get(pk=self.cart.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual((cart.total_price, cart.total_items), (expected, 100))
+        empty = Cart.objects.create(user=self.create_user('empty@example.com'))
+        self.assertEqual((empty.total_price, empty.total_items), (0, 0))
+
+    def test_cart_with_50_items_query_count(self):
+        # корзина с итогами, позиции с товарами и категориями, избранное
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/cart/')
+        self.assertEqual(len(response.data['items']), 50)
+        self.assertEqual(response.data['total_items'], 100)
+        self.assertIn(response.data['items'][0]['product']['category']['name'], {'Категория 0', 'Категория 1'})
+
+    def test_admin_changelist_does_not_query_per_cart(self):
+        for i in range(5):
+            cart = Cart.objects.create(user=self.create_user(f'user{i}@example.com'))
+            CartItem.objects.create(cart=cart, product=self.products[i], quantity=1)
+        admin = CustomUser.objects.create_superuser(email='admin@example.com', password='secret123',
+                                                    username='admin')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/admin/products/cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(len(ctx.captured_queries), 10)
+
+
+class CartSummaryTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=3, categories=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.create_user())
+
+    def summary(self):
+        response = self.client.get('/api/cart/summary/')
+        self.assertEqual(response.status_code, 200)
+        return response['X-Cache'], response.data['items'], response.data['total']
+
+    def mutate(self, method, url, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300, response.data)
+        return response
+
+    def test_cached_until_cart_changes(self):
+        self.assertEqual(self.summary(), ('MISS', 0, 0))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.summary(), ('HIT', 0, 0))
+
+        first, second, _third = self.products
+        self.mutate('post', '/api/cart/add_item/', {'product_id': first.id, 'quantity': 2})
+        self.assertEqual(self.summary(), ('MISS', 2, Decimal('20.00')))
+        item = CartItem.objects.get()
+
+        self.mutate('put', '/api/cart/update_item/', {'item_id': item.id, 'quantity': 3})
+        self.assertEqual(self.summary()[:2], ('MISS', 3))
+        self.mutate('post', '/api/cart/batch/', {'operations': [{'action': 'add', 'product_id': second.id}]})
+        self.assertEqual(self.summary()[:2], ('MISS', 4))
+        self.mutate('patch', f'/api/cart-items/{item.id}/', {'quantity': 1})
+        self.assertEqual(self.summary()[:2], ('MISS', 2))
+        self.mutate('delete', '/api/cart/remove_item/', {'item_id': item.id})
+        self.assertEqual(self.summary()[:2], ('MISS', 1))
+        self.mutate('delete', '/api/cart/clear_cart/', {})
+        self.assertEqual(self.summary(), ('MISS', 0, 0))
+
+    def test_change_in_another_worker_resets_summary(self):
+        self.assertEqual(self.summary()[0], 'MISS')
+        # Другой воркер: свой экземпляр бэкенда поверх общего хранилища
+        other_worker = caches.create_connection(CART_CACHE_ALIAS)
+        with mock.patch('products.cache.get_cart_cache', return_value=other_worker):
+            self.mutate('post', '/api/cart/add_item/', {'product_id': self.products[0].id, 'quantity': 1})
+        self.assertEqual(self.summary()[:2], ('MISS', 1))
+
+    def test_order_creation_resets_summary(self):
+        self.mutate('post', '/api/cart/add_item/', {'product_id': self.products[0].id, 'quantity': 1})
+        self.assertEqual(self.summary()[1], 1)
+        self.mutate('post', '/api/orders/', {'shipping_address': 'Минск', 'phone': '+375291234567'})
+        self.assertEqual(self.summary(), ('MISS', 0, 0))
+
+
+class CheckoutTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=20, categories=1)
+        self.user = self.create_user()
+        self.cart = Cart.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fill_cart(self, products, quantity=2):
+        CartItem.objects.bulk_create(CartItem(cart=self.cart, product=product, quantity=quantity) for product in products)
+
+    def order(self):
+        return self.client.post('/api/orders/', {'shipping_address': 'Минск', 'phone': '+375291234567'})
+
+    def test_checkout_reserves_stock_and_clears_cart(self):
+        self.fill_cart(self.products[:3])
+        response = self.order()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(str(response.data['total_price'])), Decimal('66.00'))
+        self.assertEqual(len(response.data['items']), 3)
+        self.assertEqual(set(Product.objects.filter(pk__in=[p.pk for p in self.products[:3]])
+                             .values_list('stock', flat=True)), {3})
+        self.assertEqual(Product.objects.get(pk=self.products[3].pk).stock, 5)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_checkout_snapshots_products(self):
+        Product.objects.filter(pk=self.products[0].pk).update(image='products/cube.png')
+        self.fill_cart(self.products[:2])
+        self.order()
+        self.assertEqual(
+            list(OrderItem.objects.order_by('product_id').values_list('product_name', 'product_slug', 'product_image')),
+            [('Кубик 0-0', 'cube-0-0', 'products/cube.png'), ('Кубик 0-1', 'cube-0-1', '')],
+        )
+
+    def test_checkout_invalidates_only_responses_with_bought_stock(self):
+        detail_url = f'/api/products/{self.products[0].id}/'
+        urls = ['/api/categories/', '/api/products/?fields=id,name', f'/api/products/{self.products[1].id}/', detail_url]
+        for url in urls:
+            self.client.get(url)
+        version = get_catalog_version()
+        self.fill_cart(self.products[:1])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order()
+        self.assertEqual(get_catalog_version(), version)
+        for url in urls[:-1]:
+            self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        response = self.client.get(detail_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['stock'], 3)
+
+    def test_selling_out_invalidates_catalog(self):
+        self.client.get('/api/products/', {'in_stock': 'false'})
+        version = get_catalog_version()
+        self.fill_cart(self.products[:1], quantity=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order()
+        self.assertNotEqual(get_catalog_version(), version)
+        response = self.client.get('/api/products/', {'in_stock': 'false'})
+        self.assertEqual([item['id'] for item in response.data['results']], [self.products[0].id])
+
+    def test_out_of_stock_rolls_back_everything(self):
+        self.fill_cart(self.products[:3])
+        Product.objects.filter(pk=self.products[1].pk).update(stock=1)
+        response = self.order()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(self.products[1].name, response.data['error'])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 3)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 5)
+
+    def test_empty_or_missing_cart(self):
+        self.assertEqual(self.order().status_code, 400)
+        self.cart.delete()
+        self.assertEqual(self.order().status_code, 404)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        def count_queries(lines):
+            CartItem.objects.all().delete()
+            Product.objects.update(stock=100)
+            self.fill_cart(self.products[:lines])
+            with CaptureQueriesContext(connection) as ctx:
+                checkout(self.user, 'Минск', '+375291234567')
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count_queries(1), count_queries(20))
+        self.assertEqual(OrderItem.objects.count(), 21)
+
+
+class OrderHistoryTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=10, categories=2)
+        Product.objects.filter(pk=self.products[3].pk).update(image='products/cube.png')
+        self.user = self.create_user()
+        orders = Order.objects.bulk_create(
+            Order(user=self.user, total_price=Decimal('50.00')) for _ in range(50)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=i + 1, price=product.price,
+                      product_name=product.name, product_slug=product.slug,
+                      product_image='products/cube.png' if i == 0 else '')
+            for order in orders
+            for i, product in enumerate(self.products[3:8])
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_full_history_query_count(self):
+        # заказы и позиции; таблицы каталога не читаются
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/orders/')
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertFalse(any(Product._meta.db_table in query['sql'] for query in ctx.captured_queries))
+        self.assertEqual(len(response.data), 50)
+        self.assertEqual(len(response.data[0]['items']), 5)
+        self.assertEqual(response.data[0]['items'][0]['product'], {
+            'id': self.products[3].id, 'name': 'Кубик 0-3', 'slug': 'cube-0-3',
+            'image': 'http://testserver/media/products/cube.png',
+        })
+
+        order_id = response.data[0]['id']
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/orders/{order_id}/')
+        self.assertEqual(len(response.data['items']), 5)
+
+    def test_history_survives_catalog_changes(self):
+        product = self.products[3]
+        Product.objects.filter(pk=product.pk).update(name='Переименован', image='')
+        product.delete()
+        response = self.client.get('/api/orders/')
+        self.assertEqual(response.data[0]['items'][0]['product'], {
+            'id': None, 'name': 'Кубик 0-3', 'slug': 'cube-0-3',
+            'image': 'http://testserver/media/products/cube.png',
+        })
+        self.assertEqual(OrderItem.objects.count(), 250)
+
+    def test_summary_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/orders/', {'view': 'summary'})
+        self.assertEqual(len(response.data), 50)
+        summary = response.data[0]
+        self.assertEqual(set(summary), {'id', 'status', 'status_display', 'total_price', 'total_items',
+                                        'thumbnail', 'created_at'})
+        self.assertEqual(summary['total_items'], 15)
+        self.assertEqual(summary['thumbnail'], 'http://testserver/media/products/cube.png')
+
+    def test_summary_of_empty_order(self):
+        Order.objects.create(user=self.user, total_price=Decimal('0.00'))
+        response = self.client.get('/api/orders/', {'view': 'summary'})
+        self.assertEqual((response.data[0]['total_items'], response.data[0]['thumbnail']), (0, None))
+
+
+class ExportTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=3, categories=2)
+        Product.objects.filter(pk=self.products[0].pk).update(is_available=False)
+        self.user = self.create_user()
+        self.admin = CustomUser.objects.create_superuser(email='admin@example.com', password='secret123',
+                                                         username='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create_orders(self, count, status='оформлен', day=None):
+        orders = Order.objects.bulk_create(
+            Order(user=self.user, status=status, total_price=Decimal('10.00')) for _ in range(count)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=self.products[1], quantity=1, price=Decimal('10.00'),
+                      product_name=self.products[1].name, product_slug=self.products[1].slug)
+            for order in orders
+        )
+        if day:
+            Order.objects.filter(pk__in=[order.pk for order in orders]).update(
+                created_at=datetime(2026, 1, day, 12, tzinfo=dt_timezone.utc))
+        return orders
+
+    def download(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_orders_csv_with_filters(self):
+        self.create_orders(2, day=1)
+        paid = self.create_orders(1, status='оплачен', day=2)
+        self.create_orders(1, status='оплачен', day=3)
+        Order.objects.create(user=self.user, status='оплачен', total_price=Decimal('0.00'))
+        rows = list(csv.DictReader(StringIO(self.download(
+            '/api/export/orders.csv', status='оплачен', date_from='2026-01-02', date_to='2026-01-02',
+        ))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['order_id'], str(paid[0].id))
+        self.assertEqual((rows[0]['product_name'], rows[0]['quantity'], rows[0]['price']),
+                         (self.products[1].name, '1', '10.00'))
+        self.assertEqual(rows[0]['created_at'], '2026-01-02T12:00:00+00:00')
+
+        # Заказ без позиций выгружается с пустыми колонками позиции
+        rows = list(csv.DictReader(StringIO(self.download('/api/export/orders.csv', date_from='2026-02-01'))))
+        self.assertEqual([(row['status'], row['item_id']) for row in rows], [('оплачен', '')])
+
+    def test_products_ndjson(self):
+        lines = self.download('/api/export/products.ndjson', status='hidden').splitlines()
+        self.assertEqual(len(lines), 1)
+        product = json.loads(lines[0])
+        self.assertEqual((product['id'], product['category_name'], product['price'], product['is_available']),
+                         (self.products[0].id, 'Категория 0', '10.00', False))
+        self.assertEqual(len(self.download('/api/export/products.ndjson').splitlines()), 6)
+
+    def test_rejects_bad_filters_and_non_admins(self):
+        self.assertEqual(self.client.get('/api/export/orders.csv', {'status': 'hidden'}).status_code, 400)
+        response = self.client.get('/api/export/orders.csv', {'date_from': '2026-02-02', 'date_to': '2026-02-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/export/orders.xml').status_code, 404)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/export/orders.csv').status_code, 403)
+
+    def test_command(self):
+        self.create_orders(3)
+        out = StringIO()
+        call_command('export_data', 'orders', '--format', 'ndjson', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+        with self.assertRaises(CommandError):
+            call_command('export_data', 'products', '--status', 'оплачен', stdout=StringIO())
+
+    @override_settings(EXPORT_CHUNK_SIZE=100)
+    def test_memory_does_not_grow_with_row_count(self):
+        def peak_memory(path):
+            response = self.client.get(path)
+            tracemalloc.start()
+            try:
+                for _chunk in response.streaming_content:
+                    pass
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        self.create_orders(300)
+        small = peak_memory('/api/export/orders.csv')
+        self.create_orders(2700)
+        large = peak_memory('/api/export/orders.csv')
+        # Десятикратно больше строк — пик памяти почти тот же (держится одна пачка)
+        self.assertLess(large, small * 1.5)
+
+
+class SalesRollupTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        self.create_catalog(products_per_category=3, categories=2)
+        self.user = self.create_user()
+        self.admin = CustomUser.objects.create_superuser(email='admin@example.com', password='secret123',
+                                                         username='admin')
+        self.today = timezone.localdate()
+
+    def place_order(self, *lines):
+        cart, _created = Cart.objects.get_or_create(user=self.user)
+        CartItem.objects.bulk_create(CartItem(cart=cart, product=product, quantity=quantity)
+                                     for product, quantity in lines)
+        return checkout(self.user, 'Минск', '+375291234567')
+
+    def rollup(self):
+        totals = set(DailyOrderTotals.objects.exclude(orders=0).values_list('day', 'status', 'orders', 'units', 'revenue'))
+        sales = set(DailySales.objects.exclude(orders=0).values_list(
+            'day', 'status', 'product_id', 'category_id', 'orders', 'units', 'revenue'))
+        return totals, sales
+
+    def assert_matches_rebuild(self):
+        incremental = self.rollup()
+        rebuild_sales_rollup()
+        self.assertEqual(incremental, self.rollup())
+
+    def test_checkout_updates_rollup(self):
+        first, second, third = self.products[:3]
+        self.place_order((first, 2), (second, 1))
+        self.place_order((first, 1))
+        self.assertEqual(sales_report(), [
+            {'day': self.today, 'orders': 2, 'units': 4, 'revenue': Decimal('41.00')},
+        ])
+        by_product = {row['product_id']: (row['orders'], row['units']) for row in sales_report(group_by='product')}
+        self.assertEqual(by_product, {first.id: (2, 3), second.id: (1, 1)})
+        # Один заказ с двумя товарами категории: в разрезе категорий заказы не суммируются
+        self.assertEqual(sales_report(group_by='category'), [
+            {'category_id': self.categories[0].id, 'name': 'Категория 0', 'units': 4, 'revenue': Decimal('41.00')},
+        ])
+        self.assert_matches_rebuild()
+
+    def test_status_changes_move_rollup(self):
+        order = self.place_order((self.products[0], 2))
+        other = self.place_order((self.products[3], 1))
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.patch(f'/api/orders/{order.id}/update_status/', {'status': 'оплачен'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['orders'], row['units']) for row in sales_report(status='оплачен')], [(1, 2)])
+        self.assertEqual([(row['orders'], row['units']) for row in sales_report(status='оформлен')], [(1, 1)])
+
+        # list_editable в админке сохраняет заказы через save() — сводки тоже переносятся
+        client = self.client
+        client.force_login(self.admin)
+        orders = list(Order.objects.order_by('-created_at'))
+        data = {'form-TOTAL_FORMS': 2, 'form-INITIAL_FORMS': 2, '_save': 'Сохранить'}
+        for i, changed in enumerate(orders):
+            data[f'form-{i}-id'] = changed.id
+            data[f'form-{i}-status'] = 'отправлен' if changed == other else changed.status
+        response = client.post('/admin/products/order/', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.get(pk=other.pk).status, 'отправлен')
+        self.assertEqual(sales_report(status='оформлен'), [])
+        self.assertEqual([row['units'] for row in sales_report(status='отправлен')], [1])
+        self.assert_matches_rebuild()
+
+    def test_admin_orders_and_items_update_rollup(self):
+        self.client.force_login(self.admin)
+        response = self.client.post('/admin/products/order/add/', {
+            'user': self.user.pk, 'status': 'оплачен', 'total_price': '0', 'shipping_address': 'Минск',
+            'phone': '+375291234567', 'notes': '',
+        })
+        self.assertEqual(response.status_code, 302)
+        order = Order.objects.get()
+        self.assertEqual(sales_report(), [{'day': self.today, 'orders': 1, 'units': 0, 'revenue': Decimal('0.00')}])
+        self.assert_matches_rebuild()
+
+        response = self.client.post('/admin/products/orderitem/add/', {
+            'order': order.pk, 'product': self.products[0].pk, 'quantity': 3,
+        })
+        self.assertEqual(response.status_code, 302)
+        item = OrderItem.objects.get()
+        self.assertEqual(sales_report()[0]['units'], 3)
+        self.assert_matches_rebuild()
+
+        response = self.client.post(f'/admin/products/orderitem/{item.pk}/change/', {
+            'order': order.pk, 'product': self.products[1].pk, 'quantity': 1,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual([row['product_id'] for row in sales_report(group_by='product')], [self.products[1].id])
+        self.assert_matches_rebuild()
+
+        response = self.client.post(f'/admin/products/orderitem/{item.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(sales_report()[0]['units'], 0)
+        self.assert_matches_rebuild()
+
+    def test_upserts_keep_one_row_per_key(self):
+        order = self.place_order((self.products[0], 1))
+        deleted_product = order_buckets([(None, None, 2, Decimal('5.00'))])
+        for _ in range(2):
+            record_order(order, order_buckets([(self.products[0].id, self.categories[0].id, 1, Decimal('10.00'))]))
+            record_order(order, deleted_product)
+        self.assertEqual(DailyOrderTotals.objects.count(), 1)
+        self.assertEqual(DailyOrderTotals.objects.get().orders, 5)
+        self.assertEqual(
+            sorted(DailySales.objects.values_list('product_id', 'orders', 'units'), key=str),
+            sorted([(self.products[0].id, 3, 3), (None, 2, 4)], key=str),
+        )
+        # Дубликат ключа (в том числе с NULL вместо удалённого товара) база не примет
+        for product in (self.products[0], None):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                DailySales.objects.create(day=self.today, status='оформлен', product=product,
+                                          category=self.categories[0] if product else None)
+
+    def test_failed_status_change_leaves_rollup_untouched(self):
+        order = self.place_order((self.products[0], 2))
+        before = self.rollup()
+        apply = sales._apply
+
+        def fail_on_add(order, status, buckets, sign):
+            if sign > 0:
+                raise RuntimeError('сбой')
+            apply(order, status, buckets, sign)
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        with mock.patch.object(sales, '_apply', fail_on_add):
+            response = client.patch(f'/api/orders/{order.id}/update_status/', {'status': 'оплачен'})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'оформлен')
+        self.assertEqual(self.rollup(), before)
+
+    def test_rollup_keeps_checkout_category_and_follows_deletes(self):
+        order = self.place_order((self.products[0], 1), (self.products[1], 1))
+        Product.objects.filter(pk=self.products[0].pk).update(category=self.categories[1])
+        order.status = 'оплачен'
+        order.save()
+        self.assertEqual({row['category_id'] for row in sales_report(group_by='category')}, {self.categories[0].id})
+        self.assert_matches_rebuild()
+
+        self.products[1].delete()
+        self.assert_matches_rebuild()
+        order.delete()
+        self.assertEqual(self.rollup(), (set(), set()))
+
+    def test_deleting_sold_products_and_categories_folds_rollup(self):
+        first, second = self.products[:2]
+        order = self.place_order((first, 1), (second, 2))
+        self.place_order((self.products[3], 1))
+        first.delete()
+        second.delete()
+        self.assertEqual(
+            set(DailySales.objects.filter(product=None).values_list('category_id', 'orders', 'units')),
+            {(self.categories[0].id, 2, 3)},
+        )
+        self.assert_matches_rebuild()
+        order.status = 'оплачен'
+        order.save()
+        self.assert_matches_rebuild()
+        # Категория удаляется вместе с товарами — их строки сходятся в ключ (NULL, NULL)
+        self.categories[0].delete()
+        self.categories[1].delete()
+        self.assertEqual(
+            sorted(DailySales.objects.values_list('status', 'product_id', 'category_id', 'units')),
+            [('оплачен', None, None, 3), ('оформлен', None, None, 1)],
+        )
+        self.assert_matches_rebuild()
+
+    def test_report_api(self):
+        self.place_order((self.products[0], 1))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/api/reports/sales/').status_code, 403)
+        client.force_authenticate(self.admin)
+        self.assertEqual(client.get('/api/reports/sales/', {'group_by': 'week'}).status_code, 400)
+        # Отчёт читает только сводки: один запрос независимо от числа заказов
+        with self.assertNumQueries(1):
+            response = client.get('/api/reports/sales/', {'date_from': self.today, 'date_to': self.today,
+                                                          'group_by': 'product'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['name'], self.products[0].name)
+        response = client.get('/api/reports/sales/', {'date_from': self.today + timezone.timedelta(days=1)})
+        self.assertEqual(response.data['results'], [])
+
+    def test_rebuild_command(self):
+        self.place_order((self.products[0], 3))
+        DailySales.objects.all().delete()
+        DailyOrderTotals.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_sales_rollup', '--from', str(self.today), stdout=out)
+        self.assertIn('Строк сводок: 2', out.getvalue())
+        self.assertEqual(sales_report()[0]['units'], 3)
+
+
+class CartConcurrencyTests(CatalogTestMixin, TransactionTestCase):
+    """Параллельные прибавления одного товара не теряются и не превышают остаток"""
+
+    threads = 4
+    adds_per_thread = 10
+
+    def setUp(self):
+        self.create_catalog(products_per_category=1, categories=1)
+        self.product = self.products[0]
+        Product.objects.filter(pk=self.product.pk).update(stock=1000)
+        self.cart = Cart.objects.create(user=self.create_user())
+
+    def run_threads(self, target):
+        def worker():
+            try:
+                for _ in range(self.adds_per_thread):
+                    # SQLite в тестах — общая база в памяти: при блокировке таблицы повторяем
+                    while True:
+                        try:
+                            target()
+                            break
+                        except OperationalError:
+                            pass
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_no_lost_increments(self):
+        self.run_threads(lambda: add_item(self.cart, self.product.id, 1))
+        self.assertEqual(CartItem.objects.get().quantity, self.threads * self.adds_per_thread)
+
+    def test_stock_is_never_exceeded(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=15)
+        results = []
+
+        def add():
+            try:
+                add_item(self.cart, self.product.id, 1)
+                results.append(True)
+            except CartError:
+                results.append(False)
+
+        self.run_threads(add)
+        self.assertEqual(CartItem.objects.get().quantity, 15)
+        self.assertEqual(results.count(True), 15)
+
+
+class CheckoutConcurrencyTests(CatalogTestMixin, TransactionTestCase):
+    """Параллельные заказы последних единиц товара не уводят остаток в минус"""
+
+    buyers = 8
+
+    def setUp(self):
+        self.create_catalog(products_per_category=1, categories=1)
+        self.product = self.products[0]
+        Product.objects.filter(pk=self.product.pk).update(stock=5)
+        self.users = []
+        for i in range(self.buyers):
+            user = self.create_user(f'buyer{i}@example.com')
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+            self.users.append(user)
+
+    def test_no_oversell(self):
+        results = []
+
+        def buy(user):
+            try:
+                while True:
+                    try:
+                        checkout(user, 'Минск', '+375291234567')
+                        results.append(True)
+                        return
+                    except CartError:
+                        results.append(False)
+                        return
+                    except OperationalError:
+                        # SQLite в тестах — общая база в памяти: при блокировке таблицы повторяем
+                        pass
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in self.users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 2)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 1)
+        self.assertEqual(sum(OrderItem.objects.values_list('quantity', flat=True)), 4)
@@ -0,0 +1,189 @@
+"""
+Триграммный индекс слов из названий товаров — запасной поиск с опечатками.
+
+Слова названий (без чисел) раскладываются на триграммы с пробелами по краям,
+как в pg_trgm: «кубик» → «  к», « ку», «куб», «уби», «бик», «ик ». Для каждой
+триграммы хранится множество слов, для каждого слова — множество id товаров.
+Похожие слова находятся подсчётом общих триграмм только по спискам триграмм
+запроса, без перебора словаря; сходство — коэффициент Дайса.
+
+Жизненный цикл такой же, как у products/search_index.py: ленивое построение,
+сигналы в этом процессе и досинхронизация по состоянию каталога с отметками об
+удалённых товарах.
+"""
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .sync import get_catalog_state
+from .models import Product
+from .search_index import deleted_product_ids, tokenize, tombstones_expired
+
+# Минимальное сходство слова запроса и слова из названия
+SIMILARITY_THRESHOLD = 0.4
+SYNC_OVERLAP = timedelta(minutes=5)
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def name_words(name):
+    return frozenset(token for token in tokenize(name) if not token.isdigit())
+
+
+class NameTrigramIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.trigrams = {}
+        self.words = {}
+        self.vocabulary = []
+        self.documents = {}
+        self.version = None
+        self.synced_at = None
+
+    def build(self):
+        version = get_catalog_state()
+        synced_at = timezone.now()
+        with self._lock:
+            self.version = None
+            self.trigrams = {}
+            self.words = {}
+            self.documents = {}
+            rows = Product.objects.filter(is_available=True).order_by().values_list('id', 'name')
+            for product_id, name in rows.iterator(chunk_size=5000):
+                self._add(product_id, name)
+            self.vocabulary = sorted(self.words)
+            self.version = version
+            self.synced_at = synced_at
+
+    def refresh(self):
+        version = get_catalog_state()
+        if version == self.version:
+            return
+        synced_at = timezone.now()
+        since = self.synced_at - SYNC_OVERLAP
+        if tombstones_expired(since):
+            self.build()
+            return
+        changed = (
+            Product.objects.filter(updated_at__gte=since)
+            .order_by()
+            .values_list('id', 'name', 'is_available')
+        )
+        with self._lock:
+            for product_id, name, is_available in changed.iterator(chunk_size=5000):
+                self.update(product_id, name, is_available)
+            for product_id in deleted_product_ids(since):
+                self.remove(product_id)
+            self.version = version
+            self.synced_at = synced_at
+
+    def _add(self, product_id, name):
+        words = name_words(name)
+        for word in words:
+            products = self.words.get(word)
+            if products is None:
+                products = self.words[word] = set()
+                for trigram in trigrams(word):
+                    self.trigrams.setdefault(trigram, set()).add(word)
+                if self.version is not None:
+                    insort(self.vocabulary, word)
+            products.add(product_id)
+        self.documents[product_id] = words
+
+    def remove(self, product_id):
+        with self._lock:
+            for word in self.documents.pop(product_id, ()):
+                products = self.words[word]
+                products.discard(product_id)
+                if products:
+                    continue
+                del self.words[word]
+                for trigram in trigrams(word):
+                    self.trigrams[trigram].discard(word)
+                    if not self.trigrams[trigram]:
+                        del self.trigrams[trigram]
+                index = bisect_left(self.vocabulary, word)
+                if index < len(self.vocabulary) and self.vocabulary[index] == word:
+                    del self.vocabulary[index]
+
+    def update(self, product_id, name, is_available):
+        with self._lock:
+            self.remove(product_id)
+            if is_available:
+                self._add(product_id, name)
+
+    def similar_words(self, term, threshold=SIMILARITY_THRESHOLD):
+        """Слова словаря, похожие на term: {слово: сходство}; продолжения префикса считаются точными"""
+        term_trigrams = trigrams(term)
+        shared = Counter()
+        for trigram in term_trigrams:
+            shared.update(self.trigrams.get(trigram, ()))
+        similar = {}
+        for word, count in shared.items():
+            # У слова из n букв n + 1 триграмма (повторы внутри слова редки)
+            similarity = 2 * count / (len(term_trigrams) + len(word) + 1)
+            if similarity >= threshold:
+                similar[word] = similarity
+        position = bisect_left(self.vocabulary, term)
+        while position < len(self.vocabulary) and self.vocabulary[position].startswith(term):
+            similar[self.vocabulary[position]] = 1.0
+            position += 1
+        return similar
+
+    def search(self, query):
+        """id товаров, где каждому слову запроса нашлось похожее слово в названии; сначала самые похожие"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            scores = None
+            for term in terms:
+                term_scores = {}
+                # По возрастанию сходства: у товара остаётся лучшее из его слов
+                for word, similarity in sorted(self.similar_words(term).items(), key=lambda item: item[1]):
+                    term_scores.update(dict.fromkeys(self.words[word], similarity))
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {pk: score + term_scores[pk] for pk, score in scores.items() if pk in term_scores}
+                if not scores:
+                    return []
+            # Две устойчивые сортировки вместо ключа-кортежа: при равном сходстве новее (больший id) выше
+            product_ids = sorted(scores, reverse=True)
+            product_ids.sort(key=scores.__getitem__, reverse=True)
+            return product_ids
+
+
+_index = NameTrigramIndex()
+_build_lock = threading.Lock()
+
+
+def get_trigram_index():
+    if _index.version is None:
+        with _build_lock:
+            if _index.version is None:
+                _index.build()
+                return _index
+    _index.refresh()
+    return _index
+
+
+def reset_trigram_index():
+    with _build_lock:
+        _index.__init__()
+
+
+def index_product_trigrams(product):
+    if _index.version is not None:
+        _index.update(product.id, product.name, product.is_available)
+
+
+def unindex_product_trigrams(product_id):
+    if _index.version is not None:
+        _index.remove(product_id)
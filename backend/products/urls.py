@@ -1,9 +1,9 @@
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
 from .views import (
     CategoryViewSet, ProductViewSet, CartItemViewSet, FavoriteViewSet,
-    CartViewSet, CartAddItemView, CartUpdateItemView, CartRemoveItemView, CartClearView,
-    OrderViewSet
+    CartViewSet, CartAddItemView, CartUpdateItemView, CartRemoveItemView, CartClearView, CartBatchView,
+    CartSummaryView, OrderViewSet, CatalogCacheStatsView, ExportView, SalesReportView
 )
 
 router = DefaultRouter()
@@ -15,10 +15,16 @@ router.register(r'orders', OrderViewSet, basename='order')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('catalog-cache/stats/', CatalogCacheStatsView.as_view(), name='catalog-cache-stats'),
     # Cart endpoints
     path('cart/', CartViewSet.as_view(), name='cart'),
     path('cart/add_item/', CartAddItemView.as_view(), name='cart-add-item'),
     path('cart/update_item/', CartUpdateItemView.as_view(), name='cart-update-item'),
     path('cart/remove_item/', CartRemoveItemView.as_view(), name='cart-remove-item'),
     path('cart/clear_cart/', CartClearView.as_view(), name='cart-clear'),
+    path('cart/batch/', CartBatchView.as_view(), name='cart-batch'),
+    path('cart/summary/', CartSummaryView.as_view(), name='cart-summary'),
+    # Выгрузки для администраторов: orders.csv, orders.ndjson, products.csv, products.ndjson
+    re_path(r'^export/(?P<kind>orders|products)\.(?P<export_format>csv|ndjson)$', ExportView.as_view(), name='export'),
+    path('reports/sales/', SalesReportView.as_view(), name='sales-report'),
 ]
\ No newline at end of file
@@ -1,18 +1,85 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.views import APIView
-from django.db.models import Q
-from .models import Category, Product, Cart, CartItem, Favorite, Order, OrderItem
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.http import StreamingHttpResponse
+from django.utils.functional import SimpleLazyObject
+from .models import Category, Product, Cart, CartItem, Favorite, Order
 from .serializers import (
-    CategorySerializer, ProductSerializer, CartSerializer, 
-    CartItemSerializer, AddToCartSerializer, UpdateCartItemSerializer,
-    FavoriteSerializer, OrderSerializer, CreateOrderSerializer
+    CategorySerializer, ProductSerializer, ProductListSerializer, CartSerializer, 
+    CartItemSerializer, AddToCartSerializer, UpdateCartItemSerializer, CartOperationSerializer, CartBatchSerializer,
+    FavoriteSerializer, OrderSerializer, OrderSummarySerializer, CreateOrderSerializer, ExportFilterSerializer,
+    SalesReportSerializer,
 )
-from .pagination import ProductPagination
+from .pagination import ProductPagination, get_product_paginator
+from .filters import ProductFilter, parse_id, product_facets
+from .search import search_with_typo_fallback
+from .search_cache import cached_search, get_search_cache
+from .suggest import DEFAULT_LIMIT as SUGGEST_LIMIT, MAX_LIMIT as SUGGEST_MAX_LIMIT, get_suggest_index
+from .cache import cache_catalog_response, get_cache_stats
+from .cart import (
+    CartError, add_item, apply_operations, checkout, get_cart_summary, remove_item, set_item_quantity, touch_cart,
+)
+from .export import EXPORT_FORMATS, EXPORT_STATUSES, export_lines
+from .sales import sales_report
+from .fast_serializers import category_values, product_values, serialize_categories, serialize_products
+
+
+class FavoritesContextMixin:
+    """Загружает id избранных товаров пользователя один раз на весь ответ"""
+
+    def get_favorite_ids(self):
+        # Ленивое множество: запрос выполняется, только если сериализатору нужен is_favorited
+        if not hasattr(self, '_favorite_ids'):
+            user = self.request.user
+            self._favorite_ids = SimpleLazyObject(
+                lambda: set(Favorite.objects.filter(user=user).values_list('product_id', flat=True))
+                if user.is_authenticated else set()
+            )
+        return self._favorite_ids
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['favorite_ids'] = self.get_favorite_ids()
+        return context
+
+
+class CartResponseMixin(FavoritesContextMixin):
+    """Корзина для ответа: итоги считает база, позиции с товарами и категориями — одним запросом"""
+
+    def get_cart_queryset(self):
+        items = CartItem.objects.select_related('product__category')
+        return Cart.objects.with_totals().prefetch_related(Prefetch('items', queryset=items))
+
+    def serialize_cart(self, cart):
+        return CartSerializer(cart, context={'favorite_ids': self.get_favorite_ids()}).data
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+    def cart_response(self, cart_id, status_code=status.HTTP_200_OK):
+        return Response(self.serialize_cart(self.get_cart_queryset().get(pk=cart_id)), status=status_code)
+
+
+class SparseFieldsMixin:
+    """Поддержка ?fields= и ?expand= на эндпоинтах товаров (см. ProductListSerializer)"""
+
+    def get_requested_fields(self):
+        if not hasattr(self, '_requested_fields'):
+            self._requested_fields = ProductListSerializer.parse_fields(self.request.query_params)
+        return self._requested_fields
+
+    def select_product_columns(self, queryset):
+        return ProductListSerializer.select_columns(queryset, *self.get_requested_fields())
+
+    def get_product_serializer(self, *args, **kwargs):
+        fields, expand = self.get_requested_fields()
+        kwargs.setdefault('context', self.get_serializer_context())
+        return ProductListSerializer(*args, fields=fields, expand=expand, **kwargs)
+
+
+class CategoryViewSet(SparseFieldsMixin, FavoritesContextMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     
@@ -21,101 +88,219 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
         context['request'] = self.request
         return context
     
+    @cache_catalog_response
+    def list(self, request, *args, **kwargs):
+        categories = category_values(self.filter_queryset(self.get_queryset()))
+        return Response(serialize_categories(categories, self.get_serializer_context()))
+    
+    @cache_catalog_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     @action(detail=True, methods=['get'])
+    @cache_catalog_response
     def products(self, request, pk=None):
         """Получить товары конкретной категории"""
         try:
             category = self.get_object()
-            products = Product.objects.filter(category=category, is_available=True)
+            products = Product.objects.filter(category=category, is_available=True).select_related('category')
             
-            paginator = ProductPagination()
-            paginated_products = paginator.paginate_queryset(products, request)
-            serializer = ProductSerializer(paginated_products, many=True, context={'request': request})
+            paginator = get_product_paginator(request)
+            if self.get_requested_fields()[0] is None:
+                # Полное представление собираем быстрым путём из values()
+                paginated_products = paginator.paginate_queryset(product_values(products), request)
+                return paginator.get_paginated_response(
+                    serialize_products(paginated_products, self.get_serializer_context())
+                )
+            paginated_products = paginator.paginate_queryset(self.select_product_columns(products), request)
+            serializer = self.get_product_serializer(paginated_products, many=True)
             
             return paginator.get_paginated_response(serializer.data)
         except Category.DoesNotExist:
             return Response({'error': 'Категория не найдена'}, status=status.HTTP_404_NOT_FOUND)
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Product.objects.filter(is_available=True)
+class ProductViewSet(SparseFieldsMixin, FavoritesContextMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Product.objects.filter(is_available=True).select_related('category')
     serializer_class = ProductSerializer
     pagination_class = ProductPagination
+    filterset_class = ProductFilter
+    
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = get_product_paginator(self.request)
+        return self._paginator
+    
+    def get_queryset(self):
+        return self.select_product_columns(super().get_queryset())
+    
+    def get_serializer(self, *args, **kwargs):
+        return self.get_product_serializer(*args, **kwargs)
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
     
+    @cache_catalog_response
+    def list(self, request, *args, **kwargs):
+        if self.get_requested_fields()[0] is not None:
+            response = super().list(request, *args, **kwargs)
+        else:
+            # Полное представление собираем быстрым путём из values()
+            queryset = self.filter_queryset(self.get_queryset())
+            page = self.paginate_queryset(product_values(queryset))
+            response = self.get_paginated_response(serialize_products(page, self.get_serializer_context()))
+        if request.query_params.get('facets') in ('1', 'true'):
+            response.data['facets'] = product_facets(self.queryset, request.query_params)
+        return response
+    
+    @cache_catalog_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
+    def serialize_products_by_key(self, products):
+        """Сериализует товары (быстрым путём или с учётом ?fields=); возвращает [(id, slug, данные)]"""
+        fields, expand = self.get_requested_fields()
+        if fields is None:
+            rows = list(product_values(products))
+            data = serialize_products(rows, self.get_serializer_context())
+            return [(row['id'], row['slug'], item) for row, item in zip(rows, data)]
+        # id и slug нужны для сопоставления с запросом, даже если их нет в ?fields=
+        rows = list(ProductListSerializer.select_columns(products, fields + ['slug'], expand))
+        data = self.get_serializer(rows, many=True).data
+        return [(product.id, product.slug, item) for product, item in zip(rows, data)]
+    
+    # Максимум товаров в одном запросе batch
+    MAX_BATCH_SIZE = 300
+    
     @action(detail=False, methods=['get'])
+    @cache_catalog_response
+    def batch(self, request):
+        """Несколько товаров одним запросом: ?ids=1,2,3 и/или ?slugs=a,b
+
+        Ответ — словарь в порядке запроса, ключ — запрошенный id или slug;
+        для ненайденных (или недоступных) товаров значение null.
+        """
+        ids = [value for value in request.query_params.get('ids', '').split(',') if value]
+        slugs = [value for value in request.query_params.get('slugs', '').split(',') if value]
+        if not ids and not slugs:
+            return Response({'error': 'Укажите ids или slugs'}, status=status.HTTP_400_BAD_REQUEST)
+        if any(parse_id(value) is None for value in ids):
+            return Response({'error': 'ids должны быть положительными целыми числами'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) + len(slugs) > self.MAX_BATCH_SIZE:
+            return Response({'error': f'Не больше {self.MAX_BATCH_SIZE} товаров за запрос'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        serialized = self.serialize_products_by_key(self.queryset.filter(Q(id__in=ids) | Q(slug__in=slugs)))
+        by_id = {str(product_id): data for product_id, _slug, data in serialized}
+        by_slug = {slug: data for _product_id, slug, data in serialized}
+        
+        results = {}
+        for value in ids:
+            results[value] = by_id.get(value)
+        for value in slugs:
+            results[value] = by_slug.get(value)
+        not_found = [key for key, item in results.items() if item is None]
+        return Response({'results': results, 'not_found': not_found})
+    
+    @action(detail=False, methods=['get'])
+    @cache_catalog_response
     def search(self, request):
-        """Поиск товаров по названию с пагинацией"""
+        """Поиск товаров по названию и описанию с пагинацией
+
+        Если точных совпадений нет, ищутся названия с похожими словами (опечатки),
+        и в ответе будет "fuzzy": true.
+        """
         query = request.query_params.get('q', '')
-        print(f"Поисковый запрос: '{query}'")
         
         if query:
-            # Используем базовый queryset с фильтром доступности
-            base_queryset = Product.objects.filter(is_available=True)
-            print(f"Базовый queryset содержит {base_queryset.count()} доступных товаров")
-            
-            from django.db.models import Q
-            
-            q_objects = Q()
-            
-            # 1. Поиск по оригинальному запросу (как есть)
-            q_objects |= Q(name__icontains=query)
-            
-            # 2. Поиск по запросу в верхнем регистре
-            q_objects |= Q(name__icontains=query.upper())
-            
-            # 3. Поиск по запросу в нижнем регистре
-            q_objects |= Q(name__icontains=query.lower())
-            
-            # 4. Поиск по запросу с заглавной первой буквой
-            if query:
-                capitalized_query = query[0].upper() + query[1:].lower()
-                q_objects |= Q(name__icontains=capitalized_query)
-            
-            # 5. Поиск по началу названия (независимо от регистра)
-            q_objects |= Q(name__istartswith=query)
-            q_objects |= Q(name__istartswith=query.lower())
-            q_objects |= Q(name__istartswith=query.upper())
-            
-            # 6. Поиск по словам (независимо от регистра)
-            words = query.split()
-            for word in words:
-                if len(word) >= 2:
-                    q_objects |= Q(name__icontains=word)
-                    q_objects |= Q(name__icontains=word.lower())
-                    q_objects |= Q(name__icontains=word.upper())
-            
-            products = base_queryset.filter(q_objects).distinct()
-            print(f"Комплексный поиск: найдено {products.count()} товаров")
-            
-            for product in products[:5]:
-                print(f"Найден товар: {product.name} (is_available: {product.is_available})")
-            
+            # Весь список id кэшируется по нормализованному запросу, страницы нарезаются из него
+            product_ids, fuzzy = cached_search(query, search_with_typo_fallback)
             paginator = ProductPagination()
-            paginated_products = paginator.paginate_queryset(products, request)
-            serializer = self.get_serializer(paginated_products, many=True)
-            return paginator.get_paginated_response(serializer.data)
+            page_ids = paginator.paginate_queryset(product_ids, request)
+            # Страницу перечитываем из базы: товар мог стать недоступным в другом процессе
+            serialized = self.serialize_products_by_key(self.queryset.filter(id__in=page_ids))
+            by_id = {product_id: data for product_id, _slug, data in serialized}
+            response = paginator.get_paginated_response([by_id[pk] for pk in page_ids if pk in by_id])
+            response.data['fuzzy'] = fuzzy
+            return response
         return Response([])
+    
+    @action(detail=False, methods=['get'])
+    @cache_catalog_response
+    def suggest(self, request):
+        """Подсказки для строки поиска: ?q=префикс&limit=10 — категории и товары"""
+        try:
+            limit = min(int(request.query_params.get('limit', SUGGEST_LIMIT)), SUGGEST_MAX_LIMIT)
+        except ValueError:
+            return Response({'error': 'limit должен быть целым числом'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_suggest_index().suggest(request.query_params.get('q', ''), max(limit, 1)))
+
+class CatalogCacheStatsView(APIView):
+    """Статистика кэша ответов каталога и кэша результатов поиска (для мониторинга)"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        return Response({**get_cache_stats(), 'search': get_search_cache().stats()})
+
+
+class ExportView(APIView):
+    """Потоковая выгрузка заказов или товаров: /api/export/orders.csv?date_from=&date_to=&status=
+
+    Файл отдаётся по мере чтения из базы (products/export.py), память не растёт с числом строк.
+    Сессия поддерживается, чтобы администратор мог скачать файл, будучи залогиненным в админке.
+    """
+    permission_classes = [IsAdminUser]
+    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    
+    def get(self, request, kind, export_format):
+        filters = ExportFilterSerializer(data=request.query_params, context={'statuses': EXPORT_STATUSES[kind]})
+        if not filters.is_valid():
+            return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(
+            export_lines(kind, export_format, **filters.validated_data),
+            content_type=f'{EXPORT_FORMATS[export_format]}; charset=utf-8',
+        )
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{export_format}"'
+        return response
+
+
+class SalesReportView(APIView):
+    """Продажи за период из дневных сводок (products/sales.py): /api/reports/sales/?date_from=&date_to=&status=&group_by="""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        params = SalesReportSerializer(data=request.query_params, context={'statuses': EXPORT_STATUSES['orders']})
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'group_by': params.validated_data['group_by'], 'results': sales_report(**params.validated_data)})
 
-class CartViewSet(APIView):
+class CartViewSet(CartResponseMixin, APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
         """Получить корзину текущего пользователя"""
         try:
-            cart, created = Cart.objects.get_or_create(user=request.user)
-            serializer = CartSerializer(cart)
-            return Response(serializer.data)
+            cart, created = self.get_cart_queryset().get_or_create(user=request.user)
+            return Response(self.serialize_cart(cart))
         except Exception as e:
             print(f"Error in my_cart: {e}")
             import traceback
             traceback.print_exc()
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class CartAddItemView(APIView):
+class CartSummaryView(APIView):
+    """Число товаров и сумма корзины для шапки сайта — из кэша, сбрасывается при изменении корзины"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        summary, hit = get_cart_summary(request.user)
+        response = Response(summary)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+class CartAddItemView(CartResponseMixin, APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
@@ -124,30 +309,13 @@ class CartAddItemView(APIView):
             serializer = AddToCartSerializer(data=request.data)
             if serializer.is_valid():
                 cart, created = Cart.objects.get_or_create(user=request.user)
-                product_id = serializer.validated_data['product_id']
-                quantity = serializer.validated_data['quantity']
-                
                 try:
-                    product = Product.objects.get(id=product_id, is_available=True)
-                except Product.DoesNotExist:
-                    return Response({'error': 'Товар не найден или недоступен'}, status=status.HTTP_404_NOT_FOUND)
-                
-                if product.stock < quantity:
-                    return Response({'error': 'Недостаточно товара на складе'}, status=status.HTTP_400_BAD_REQUEST)
+                    # Прибавление и проверка остатка одним оператором (products/cart.py)
+                    add_item(cart, serializer.validated_data['product_id'], serializer.validated_data['quantity'])
+                except CartError as e:
+                    return Response({'error': e.message}, status=e.status_code)
                 
-                cart_item, created = CartItem.objects.get_or_create(
-                    cart=cart, 
-                    product=product,
-                    defaults={'quantity': quantity}
-                )
-                
-                if not created:
-                    cart_item.quantity += quantity
-                    cart_item.save()
-                
-                cart.save()
-                serializer = CartSerializer(cart)
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
+                return self.cart_response(cart.id, status.HTTP_201_CREATED)
             
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
@@ -156,7 +324,7 @@ class CartAddItemView(APIView):
             traceback.print_exc()
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class CartUpdateItemView(APIView):
+class CartUpdateItemView(CartResponseMixin, APIView):
     permission_classes = [IsAuthenticated]
     
     def put(self, request):
@@ -164,28 +332,14 @@ class CartUpdateItemView(APIView):
         try:
             serializer = UpdateCartItemSerializer(data=request.data)
             if serializer.is_valid():
-                item_id = serializer.validated_data['item_id']
-                quantity = serializer.validated_data['quantity']
-                
                 try:
-                    cart_item = CartItem.objects.get(id=item_id, cart__user=request.user)
-                except CartItem.DoesNotExist:
-                    return Response({'error': 'Элемент корзины не найден'}, status=status.HTTP_404_NOT_FOUND)
-                
-                if quantity <= 0:
-                    cart_item.delete()
-                else:
-                    if cart_item.product.stock < quantity:
-                        return Response({'error': 'Недостаточно товара на складе'}, status=status.HTTP_400_BAD_REQUEST)
-                    
-                    cart_item.quantity = quantity
-                    cart_item.save()
-                
-                cart = cart_item.cart
-                cart.save()
+                    cart_id = set_item_quantity(
+                        request.user, serializer.validated_data['item_id'], serializer.validated_data['quantity']
+                    )
+                except CartError as e:
+                    return Response({'error': e.message}, status=e.status_code)
                 
-                serializer = CartSerializer(cart)
-                return Response(serializer.data)
+                return self.cart_response(cart_id)
             
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
@@ -194,7 +348,7 @@ class CartUpdateItemView(APIView):
             traceback.print_exc()
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class CartRemoveItemView(APIView):
+class CartRemoveItemView(CartResponseMixin, APIView):
     permission_classes = [IsAuthenticated]
     
     def delete(self, request):
@@ -205,23 +359,52 @@ class CartRemoveItemView(APIView):
                 return Response({'error': 'ID элемента корзины обязателен'}, status=status.HTTP_400_BAD_REQUEST)
             
             try:
-                cart_item = CartItem.objects.get(id=item_id, cart__user=request.user)
-            except CartItem.DoesNotExist:
-                return Response({'error': 'Элемент корзины не найден'}, status=status.HTTP_404_NOT_FOUND)
+                cart_id = remove_item(request.user, item_id)
+            except CartError as e:
+                return Response({'error': e.message}, status=e.status_code)
             
-            cart = cart_item.cart
-            cart_item.delete()
-            cart.save()
-            
-            serializer = CartSerializer(cart)
-            return Response(serializer.data)
+            return self.cart_response(cart_id)
         except Exception as e:
             print(f"Error in remove_item: {e}")
             import traceback
             traceback.print_exc()
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class CartClearView(APIView):
+class CartBatchView(CartResponseMixin, APIView):
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        """Пакет операций add/update/remove одной транзакцией
+
+        Тело: {"operations": [{"action": "add", "product_id": 1, "quantity": 2},
+        {"action": "update", "item_id": 5, "quantity": 3}, {"action": "remove", "item_id": 6}],
+        "atomic": false}. Ответ — итоговая корзина и результат каждой операции.
+        При "atomic": true любая ошибка отменяет весь пакет (статус 400).
+        """
+        serializer = CartBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        operations = []
+        for data in serializer.validated_data['operations']:
+            operation = CartOperationSerializer(data=data)
+            if operation.is_valid():
+                operations.append(operation.validated_data)
+            else:
+                operations.append({'error': operation.errors})
+        
+        cart, created = Cart.objects.get_or_create(user=request.user)
+        atomic = serializer.validated_data['atomic']
+        results = apply_operations(cart, operations, atomic=atomic)
+        failed = any(result['status'] == 'error' for result in results)
+        
+        data = {
+            'cart': self.serialize_cart(self.get_cart_queryset().get(pk=cart.id)),
+            'results': results,
+        }
+        return Response(data, status=status.HTTP_400_BAD_REQUEST if atomic and failed else status.HTTP_200_OK)
+
+class CartClearView(CartResponseMixin, APIView):
     permission_classes = [IsAuthenticated]
     
     def delete(self, request):
@@ -229,10 +412,9 @@ class CartClearView(APIView):
         try:
             cart = Cart.objects.get(user=request.user)
             cart.items.all().delete()
-            cart.save()
+            touch_cart(cart.id, request.user.pk)
             
-            serializer = CartSerializer(cart)
-            return Response(serializer.data)
+            return self.cart_response(cart.id)
         except Cart.DoesNotExist:
             return Response({'error': 'Корзина не найдена'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
@@ -241,14 +423,22 @@ class CartClearView(APIView):
             traceback.print_exc()
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class CartItemViewSet(viewsets.ModelViewSet):
+class CartItemViewSet(FavoritesContextMixin, viewsets.ModelViewSet):
     serializer_class = CartItemSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return CartItem.objects.filter(cart__user=self.request.user)
+        return CartItem.objects.filter(cart__user=self.request.user).select_related('product__category')
+    
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        touch_cart(serializer.instance.cart_id, self.request.user.pk)
+    
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        touch_cart(instance.cart_id, self.request.user.pk)
 
-class FavoriteViewSet(viewsets.ModelViewSet):
+class FavoriteViewSet(FavoritesContextMixin, viewsets.ModelViewSet):
     serializer_class = FavoriteSerializer
     permission_classes = [IsAuthenticated]
     
@@ -286,55 +476,50 @@ class FavoriteViewSet(viewsets.ModelViewSet):
         return Response({'count': count})
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(FavoritesContextMixin, viewsets.ModelViewSet):
     """ViewSet для заказов"""
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
     
+    def is_summary_view(self):
+        return self.action == 'list' and self.request.query_params.get('view') == 'summary'
+    
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        orders = Order.objects.filter(user=self.request.user)
+        # Краткий список — один запрос; полный — заказы, позиции с товарами и категориями, избранное
+        if self.is_summary_view():
+            return orders.with_summary()
+        return orders.with_items()
+    
+    def get_serializer_class(self):
+        if self.is_summary_view():
+            return OrderSummarySerializer
+        return OrderSerializer
     
     def create(self, request):
         """Создать заказ из корзины"""
         try:
-            # Получаем корзину пользователя
-            cart = Cart.objects.get(user=request.user)
-            if not cart.items.exists():
-                return Response({'error': 'Корзина пуста'}, status=status.HTTP_400_BAD_REQUEST)
-            
             # Валидируем данные заказа
             serializer = CreateOrderSerializer(data=request.data)
             if not serializer.is_valid():
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             
-            # Создаем заказ
-            order = Order.objects.create(
-                user=request.user,
-                total_price=cart.total_price,
-                shipping_address=serializer.validated_data['shipping_address'],
-                phone=serializer.validated_data['phone'],
-                notes=serializer.validated_data.get('notes', '')
-            )
-            
-            # Создаем элементы заказа
-            for cart_item in cart.items.all():
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    quantity=cart_item.quantity,
-                    price=cart_item.product.price
+            # Списание остатков, позиции заказа и очистка корзины — одной транзакцией (products/cart.py)
+            try:
+                order = checkout(
+                    request.user,
+                    shipping_address=serializer.validated_data['shipping_address'],
+                    phone=serializer.validated_data['phone'],
+                    notes=serializer.validated_data.get('notes', ''),
                 )
-            
-            # Очищаем корзину
-            cart.items.all().delete()
-            cart.save()
+            except CartError as e:
+                return Response({'error': e.message}, status=e.status_code)
             
             # Возвращаем созданный заказ
-            order_serializer = OrderSerializer(order)
+            order = Order.objects.with_items().get(pk=order.pk)
+            order_serializer = OrderSerializer(order, context={'favorite_ids': self.get_favorite_ids()})
             return Response(order_serializer.data, status=status.HTTP_201_CREATED)
             
-        except Cart.DoesNotExist:
-            return Response({'error': 'Корзина не найдена'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             print(f"Error creating order: {e}")
             import traceback
@@ -348,16 +533,18 @@ class OrderViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Доступ запрещен'}, status=status.HTTP_403_FORBIDDEN)
         
         try:
-            order = Order.objects.get(pk=pk)
+            order = Order.objects.with_items().get(pk=pk)
             new_status = request.data.get('status')
             
             if new_status not in dict(Order.STATUS_CHOICES):
                 return Response({'error': 'Неверный статус'}, status=status.HTTP_400_BAD_REQUEST)
             
-            order.status = new_status
-            order.save()
+            # Сохранение и перенос заказа между сводками продаж (сигналы Order) — одной транзакцией
+            with transaction.atomic():
+                order.status = new_status
+                order.save()
             
-            serializer = OrderSerializer(order)
+            serializer = OrderSerializer(order, context={'favorite_ids': self.get_favorite_ids()})
             return Response(serializer.data)
             
         except Order.DoesNotExist: